@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+'''XoWSClient benchmarks against xows.testing.MockCodec on localhost.
+
+Covers pipelined xGet round trips at several depths, feedback ingestion,
+connect / auth time and a 500 client XoWSFleet fan-out. Results are written
+as JSON, with p50 / p99 latency in milliseconds and peak RSS, so runs from
+two commits can be compared:
+
+    python3 benchmarks/client.py -o before.json
+    python3 benchmarks/client.py -o after.json
+    python3 benchmarks/client.py --compare before.json after.json
+'''
+
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+import xows
+from xows.testing import MockCodec
+
+
+VOLUME = ['Status', 'Audio', 'Volume']
+
+
+def percentile(samples, pct):
+    'Returns the pct percentile of samples, nearest rank.'
+    samples = sorted(samples)
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def rss_mb():
+    'Peak resident set size of this process, in MB.'
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def summary(latencies, count, elapsed):
+    'Builds a result dict from latencies in seconds.'
+    return {
+        'count': count,
+        'seconds': round(elapsed, 4),
+        'per_second': round(count / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 4) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 4) if latencies else None,
+        'rss_mb': round(rss_mb(), 1),
+    }
+
+
+async def bench_pipelined(depth, count):
+    'count xGet calls, keeping depth calls in flight.'
+    latencies = []
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            async def worker(calls):
+                for _ in range(calls):
+                    start = time.perf_counter()
+                    await client.xGet(VOLUME)
+                    latencies.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(count // depth) for _ in range(depth)))
+            elapsed = time.perf_counter() - start
+    return summary(latencies, len(latencies), elapsed)
+
+
+async def bench_feedback(count):
+    'Time for the client to receive count feedback events sent back to back.'
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url, dispatch_maxsize=count) as client:
+            received = asyncio.get_running_loop().create_future()
+            seen = []
+            def handler(data, _):
+                seen.append(data)
+                if len(seen) == count:
+                    received.set_result(None)
+            await client.subscribe(['Status', '**'], handler)
+            start = time.perf_counter()
+            for level in range(count):
+                await codec.update({'Status': {'Audio': {'Volume': level % 100}}})
+            await received
+            elapsed = time.perf_counter() - start
+    return summary([], count, elapsed)
+
+
+async def bench_connect(count):
+    'Sequential connect, authenticate and disconnect.'
+    latencies = []
+    async with MockCodec(password='secret') as codec:
+        start = time.perf_counter()
+        for _ in range(count):
+            t_0 = time.perf_counter()
+            client = xows.XoWSClient(codec.url, password='secret')
+            await client.connect()
+            latencies.append(time.perf_counter() - t_0)
+            await client.disconnect()
+        elapsed = time.perf_counter() - start
+    return summary(latencies, count, elapsed)
+
+
+async def bench_fleet(clients):
+    'Connect clients to one MockCodec with XoWSFleet, then fan out an xGet.'
+    async with MockCodec() as codec:
+        hosts = [f'{codec.url}?client={n}' for n in range(clients)]
+        start = time.perf_counter()
+        async with xows.XoWSFleet(hosts, max_connects=100) as fleet:
+            connected = time.perf_counter() - start
+            latencies = []
+            start = time.perf_counter()
+            async for res in fleet.xGet(VOLUME):
+                if res.error is None:
+                    latencies.append(time.perf_counter() - start)
+            elapsed = time.perf_counter() - start
+            ret = summary(latencies, len(latencies), elapsed)
+            ret['connect_seconds'] = round(connected, 4)
+            ret['failed'] = len(fleet.failed)
+    return ret
+
+
+async def run(quick):
+    scale = 10 if quick else 1
+    results = {}
+    for depth in (1, 10, 100):
+        results[f'xget_depth_{depth}'] = await bench_pipelined(depth, 20000 // scale)
+    results['feedback_ingest'] = await bench_feedback(50000 // scale)
+    results['connect'] = await bench_connect(500 // scale)
+    clients = 500 // scale
+    results[f'fleet_{clients}'] = await bench_fleet(clients)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))
+                              ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_file, after_file):
+    'Prints the change between two result files.'
+    with open(before_file) as fh:
+        before = json.load(fh)
+    with open(after_file) as fh:
+        after = json.load(fh)
+    print(f'{before["revision"]} -> {after["revision"]}')
+    for name, old in before['results'].items():
+        new = after['results'].get(name)
+        if new is None:
+            continue
+        print(name)
+        for key in ('per_second', 'p50_ms', 'p99_ms', 'rss_mb'):
+            if old.get(key) and new.get(key) is not None:
+                change = (new[key] - old[key]) / old[key] * 100
+                print(f'  {key:11} {old[key]:12} {new[key]:12} {change:+7.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-o', '--output', help='write JSON results to this file')
+    parser.add_argument('--quick', action='store_true',
+                        help='run a tenth of the iterations')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='compare two result files instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'json_backend': xows.jsonlib.get_backend().name,
+        'results': asyncio.run(run(args.quick)),
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+'''Startup time of import xows and clixows, against a budget.
+
+Each case runs in a fresh interpreter, repeated, and the median wall time
+over a bare interpreter start is compared to its budget in milliseconds.
+Also checks that neither imports aiohttp or asyncio. Exits with status 1 if
+any budget is exceeded, so it can run in CI:
+
+    python3 benchmarks/import_time.py
+    python3 benchmarks/import_time.py --repeat 50 -o import.json
+'''
+
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ('aiohttp', 'asyncio')
+
+CHECK_MODULES = '''
+import sys
+{}
+sys.stderr.write(' '.join(sorted(set(sys.modules) & set({!r}))))
+'''
+
+# name: (python arguments, default budget in ms over a bare interpreter)
+CASES = {
+    'import_xows': (['-c', 'import xows'], 15),
+    'clixows_help': (['-m', 'xows', '--help'], 120),
+    'clixows_command_help': (['-m', 'xows', 'host', 'get', '--help'], 120),
+}
+
+
+def run(args):
+    'Wall time of one interpreter run with args, in seconds.'
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + args, cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def median_ms(args, repeat):
+    return statistics.median(run(args) for _ in range(repeat)) * 1000
+
+
+def heavy_modules(args):
+    'HEAVY modules imported when running args.'
+    if args[0] == '-c':
+        code = args[1]
+    else:
+        code = f'import runpy, sys; sys.argv = {args[1:]!r}\n' \
+               f'try: runpy.run_module({args[1]!r}, run_name="__main__")\n' \
+               'except SystemExit: pass'
+    out = subprocess.run([sys.executable, '-c', CHECK_MODULES.format(code, HEAVY)],
+                         cwd=ROOT, check=True, capture_output=True, text=True)
+    return out.stderr.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-o', '--output', help='write JSON results to this file')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='runs per case, default 20')
+    for name, (_, budget) in CASES.items():
+        parser.add_argument(f'--budget-{name.replace("_", "-")}', type=float,
+                            default=budget, metavar='MS',
+                            help=f'budget for {name}, default {budget} ms')
+    args = parser.parse_args()
+
+    baseline = median_ms(['-c', 'pass'], args.repeat)
+    results = {'python': sys.version.split()[0], 'baseline_ms': round(baseline, 1),
+               'results': {}}
+    failed = False
+    for name, (case, _) in CASES.items():
+        budget = getattr(args, f'budget_{name}')
+        elapsed = median_ms(case, args.repeat) - baseline
+        heavy = heavy_modules(case)
+        ok = elapsed <= budget and not heavy
+        failed = failed or not ok
+        results['results'][name] = {'ms': round(elapsed, 1), 'budget_ms': budget,
+                                    'heavy_imports': heavy, 'ok': ok}
+        print(f'{name:22} {elapsed:7.1f} ms  budget {budget:6.1f} ms'
+              f'{"  imports " + ", ".join(heavy) if heavy else ""}'
+              f'  {"ok" if ok else "FAIL"}')
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(json.dumps(results, indent=2) + '\n')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+'''Frames per second for each installed JSON backend in xows.jsonlib.
+
+Decodes and encodes hand-written sample frames shaped like the feedback
+events a Room Kit sends for a '**' subscription. Pass a file with one frame
+per line, e.g. recorded from a real codec, to use your own payloads instead:
+
+    python3 benchmarks/json_backends.py [frames.ndjson]
+'''
+
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xows import jsonlib # pylint: disable=wrong-import-position
+
+
+SAMPLE_FRAMES = [
+    {'jsonrpc': '2.0', 'method': 'xFeedback/Event', 'params': {
+        'Id': 0, 'Status': {'Audio': {'Volume': 50}}}},
+    {'jsonrpc': '2.0', 'method': 'xFeedback/Event', 'params': {
+        'Id': 0, 'Status': {'RoomAnalytics': {'PeopleCount': {'Current': 3}}}}},
+    {'jsonrpc': '2.0', 'method': 'xFeedback/Event', 'params': {
+        'Id': 0, 'Status': {'Audio': {'Input': {'Connectors': {'Microphone': [
+            {'id': 1, 'VuMeter': 23}, {'id': 2, 'VuMeter': 19},
+            {'id': 3, 'VuMeter': 0}]}}}}}},
+    {'jsonrpc': '2.0', 'method': 'xFeedback/Event', 'params': {
+        'Id': 0, 'Status': {'Call': [{
+            'id': 23, 'AnswerState': 'Answered', 'CallType': 'Video',
+            'CallbackNumber': 'sip:room.kit@example.com',
+            'DeviceType': 'Endpoint', 'Direction': 'outgoing',
+            'DisplayName': 'Room Kit', 'Duration': 0, 'Encryption': {
+                'Type': 'Aes-128'},
+            'PlacedOnHold': 'False', 'Protocol': 'Sip',
+            'ReceiveCallRate': 6000, 'RemoteNumber': 'room.kit@example.com',
+            'Status': 'Connected', 'TransmitCallRate': 6000}]}}},
+    {'jsonrpc': '2.0', 'method': 'xFeedback/Event', 'params': {
+        'Id': 0, 'Status': {'SystemUnit': {'State': {
+            'NumberOfActiveCalls': 1, 'NumberOfInProgressCalls': 0,
+            'NumberOfSuspendedCalls': 0}}}}},
+    {'jsonrpc': '2.0', 'method': 'xFeedback/Event', 'params': {
+        'Id': 0, 'Status': {'MediaChannels': {'Call': [{'id': 23, 'Channel': [
+            {'id': 459, 'Direction': 'incoming', 'Type': 'Video', 'Netstat': {
+                'Bytes': 5823345, 'ChannelRate': 4386000, 'Jitter': 2,
+                'LastIntervalLost': 0, 'LastIntervalReceived': 1120,
+                'Loss': 0, 'MaxJitter': 5, 'Packets': 5419}},
+            {'id': 460, 'Direction': 'incoming', 'Type': 'Audio', 'Netstat': {
+                'Bytes': 342112, 'ChannelRate': 64000, 'Jitter': 1,
+                'LastIntervalLost': 0, 'LastIntervalReceived': 250,
+                'Loss': 0, 'MaxJitter': 2, 'Packets': 2711}}]}]}}}},
+]
+
+
+def bench(fun, items, duration=1.0):
+    'Returns calls per second of fun over items, run for about duration.'
+    count = 0
+    start = time.perf_counter()
+    while True:
+        for item in items:
+            fun(item)
+        count += len(items)
+        elapsed = time.perf_counter() - start
+        if elapsed >= duration:
+            return count / elapsed
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as fh:
+            frames = [json.loads(line) for line in fh if line.strip()]
+    else:
+        frames = SAMPLE_FRAMES
+    texts = [json.dumps(frame) for frame in frames]
+
+    print(f'{len(frames)} frames, {sum(map(len, texts)) // len(texts)} bytes avg')
+    print(f'{"backend":10} {"decode/s":>12} {"encode/s":>12}')
+    for name in jsonlib.available_backends():
+        backend = jsonlib.get_backend(name)
+        decode = bench(backend.loads, texts)
+        encode = bench(backend.dumps, frames)
+        print(f'{name:10} {decode:12,.0f} {encode:12,.0f}')
+
+
+if __name__ == '__main__':
+    main()
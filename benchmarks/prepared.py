@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+'''Prepared calls (XoWSClient.prepare()) against regular calls.
+
+Measures the client side cost of building and encoding a request, for each
+installed JSON backend, then pipelined round trips against
+xows.testing.MockCodec on localhost:
+
+    python3 benchmarks/prepared.py [--calls 20000]
+'''
+
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position,protected-access
+import xows
+from xows import jsonlib
+from xows.testing import MockCodec
+
+
+COMMAND = ['Audio', 'Volume', 'Set']
+VOLUME = ['Status', 'Audio', 'Volume']
+
+
+def per_second(fun, duration=1.0):
+    'Returns calls per second of fun, run for about duration.'
+    count = 0
+    start = time.perf_counter()
+    while True:
+        for _ in range(1000):
+            fun()
+        count += 1000
+        elapsed = time.perf_counter() - start
+        if elapsed >= duration:
+            return count / elapsed
+
+
+async def encode(backend):
+    client = xows.XoWSClient('localhost', json_backend=backend)
+    prepared_command = client.prepare('xCommand', COMMAND)
+    prepared_get = client.prepare('xGet', VOLUME)
+
+    def regular_command():
+        req, _ = client._new_request('xCommand/' + '/'.join(COMMAND), {'Level': 50})
+        client._dumps(req)
+        client._resolve(req['id'])
+
+    def prepared_command_():
+        id_, _ = client._register(prepared_command.method)
+        prepared_command._encode(id_, {'Level': 50})
+        client._resolve(id_)
+
+    def regular_get():
+        req, _ = client._new_request('xGet', {'Path': VOLUME})
+        client._dumps(req)
+        client._resolve(req['id'])
+
+    def prepared_get_():
+        id_, _ = client._register(prepared_get.method)
+        prepared_get._encode(id_, {})
+        client._resolve(id_)
+
+    return [(name, per_second(regular), per_second(prepared)) for name, regular, prepared in (
+        ('xCommand', regular_command, prepared_command_),
+        ('xGet', regular_get, prepared_get_))]
+
+
+async def round_trips(calls, window=100):
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            set_volume = client.prepare('xCommand', COMMAND)
+            results = []
+            for name, call in (
+                    ('regular', lambda level: client.xCommand(COMMAND, Level=level)),
+                    ('prepared', lambda level: set_volume(Level=level))):
+                start = time.perf_counter()
+                for first in range(0, calls, window):
+                    await asyncio.gather(*(call(level % 100)
+                                           for level in range(first, first + window)))
+                results.append((name, calls / (time.perf_counter() - start)))
+            return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--calls', type=int, default=20000,
+                        help='round trips per case')
+    args = parser.parse_args()
+
+    print(f'{"encode":18} {"regular/s":>12} {"prepared/s":>12} {"speedup":>8}')
+    for backend in jsonlib.available_backends():
+        for name, regular, prepared in await encode(backend):
+            print(f'{backend + " " + name:18} {regular:12,.0f} {prepared:12,.0f} '
+                  f'{prepared / regular:7.2f}x')
+    print()
+    print(f'{"round trips":18} {"calls/s":>12}')
+    for name, rate in await round_trips(args.calls):
+        print(f'{name:18} {rate:12,.0f}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
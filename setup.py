@@ -15,8 +15,12 @@ setuptools.setup(
     python_requires='>=3.7',
     install_requires=[
         "aiohttp >= 3.1",
-        "click >= 6.0",
+        "click >= 8.0",
     ],
+    extras_require={
+        "fast": ["orjson >= 3.0"],
+        "test": ["pytest"],
+    },
     packages=['xows'],
     entry_points={
         'console_scripts': ['clixows=xows.__main__:cli'],
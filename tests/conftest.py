@@ -0,0 +1,18 @@
+'''Runs async test functions, each in its own event loop, so the tests only
+need pytest.'''
+
+
+import asyncio
+import inspect
+
+import pytest
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    args = {name: pyfuncitem.funcargs[name]
+            for name in pyfuncitem._fixtureinfo.argnames} # pylint: disable=protected-access
+    asyncio.run(asyncio.wait_for(pyfuncitem.obj(**args), 10))
+    return True
@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+import pytest
+
+import xows
+from xows.admission import ConnectAdmission
+from xows.testing import MockCodec
+
+
+async def test_max_concurrent():
+    admission = ConnectAdmission(max_concurrent=2)
+    running = peak = 0
+
+    async def open_():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return 'open'
+
+    results = await asyncio.gather(*(admission.connect(open_) for _ in range(6)))
+    assert results == ['open'] * 6
+    assert peak == 2
+    assert admission.stats()['connected'] == 6
+
+
+async def test_rate():
+    admission = ConnectAdmission(rate=50, burst=1)
+
+    async def open_():
+        pass
+
+    start = time.monotonic()
+    await asyncio.gather(*(admission.admit(open_) for _ in range(6)))
+    # The first token is there, the other five take 1/50 s each
+    assert time.monotonic() - start >= 0.09
+    assert admission.stats()['attempts'] == 6
+
+
+async def test_retries_rate_limited_connects():
+    async with MockCodec(fail_status=503, fail_count=2, retry_after=0) as codec:
+        admission = ConnectAdmission(retry_delay=0.01)
+        async with xows.XoWSClient(codec.url, admission=admission) as client:
+            assert client.connected
+        stats = admission.stats()
+        assert stats['connected'] == 1 and stats['failed'] == 0
+        assert stats['retried'] == 2 and stats['rate_limited'] == 2
+
+
+async def test_gives_up():
+    async with MockCodec(fail_status=502) as codec:
+        admission = ConnectAdmission(retries=1, retry_delay=0.01)
+        with pytest.raises(xows.ProxyError):
+            await xows.XoWSClient(codec.url, admission=admission).connect()
+        stats = admission.stats()
+        assert stats['failed'] == 1 and stats['attempts'] == 2
+        assert stats['rate_limited'] == 0
+
+
+async def test_fleet_shares_admission():
+    async with MockCodec() as codec:
+        admission = ConnectAdmission(max_concurrent=1, rate=100)
+        hosts = [codec.url + f'?{n}' for n in range(3)]
+        async with xows.XoWSFleet(hosts, admission=admission) as fleet:
+            assert not fleet.failed
+            assert fleet.connect_stats()['connected'] == 3
@@ -0,0 +1,64 @@
+import asyncio
+import io
+
+from click.testing import CliRunner
+
+import xows
+from xows.__main__ import LineWriter, cli, read_hosts
+from xows.schema import SchemaCache
+from xows.testing import MockCodec
+
+
+class ClosedPipe(io.StringIO):
+    def write(self, _):
+        raise BrokenPipeError()
+
+
+async def test_line_writer_batches():
+    stream = io.StringIO()
+    writer = LineWriter(stream, interval=10, lines=2)
+    writer.write('a\n')
+    assert stream.getvalue() == ''
+    writer.write('b\n')
+    assert stream.getvalue() == 'a\nb\n'
+    writer.write('c\n')
+    writer.flush()
+    assert stream.getvalue() == 'a\nb\nc\n'
+
+
+async def test_line_writer_broken_pipe():
+    gone = []
+    writer = LineWriter(ClosedPipe(), interval=10, lines=1,
+                        on_broken_pipe=lambda: gone.append(True))
+    writer.write('a\n')
+    writer.write('b\n')
+    writer.flush()
+    assert writer.broken
+    assert gone == [True]
+
+
+def test_read_hosts():
+    assert read_hosts(['codec1\n', '\n', '# comment\n', 'codec2  # room 2\n']) == [
+        'codec1', 'codec2']
+
+
+def test_schema_check(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+
+    async def cache_schema():
+        async with MockCodec() as codec:
+            async with xows.XoWSClient(codec.url) as client:
+                await SchemaCache().get(client)
+            return codec.url
+
+    url = asyncio.run(cache_schema())
+    args = [url, 'command', 'Audio', 'Volume', 'Set', 'Level=300']
+    result = CliRunner().invoke(cli, ['--no-daemon'] + args)
+    assert result.exit_code == 1
+    assert f'clixows {url} schema' in result.output
+    assert '--no-schema' in result.output
+
+    # Skipping the check sends the call, to a codec that is gone by now
+    result = CliRunner().invoke(cli, ['--no-daemon', '--no-schema'] + args)
+    assert 'cached schema' not in result.output
+    assert isinstance(result.exception, ConnectionError)
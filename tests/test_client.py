@@ -0,0 +1,215 @@
+import asyncio
+
+import pytest
+
+import xows
+from xows.testing import MockCodec
+
+
+VOLUME = ['Status', 'Audio', 'Volume']
+SET_VOLUME = ['Audio', 'Volume', 'Set']
+
+
+def record_frames(client):
+    'Makes client remember every frame it sends.'
+    frames = []
+    send = client.send
+
+    async def recording(message):
+        frames.append(message)
+        await send(message)
+
+    client.send = recording
+    return frames
+
+
+async def test_calls():
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            assert await client.xGet(VOLUME) == 50
+            assert await client.xCommand(SET_VOLUME, Level=30) == {'status': 'OK'}
+            assert await client.xGet(VOLUME) == 30
+            with pytest.raises(xows.InvalidParameter):
+                await client.xCommand(SET_VOLUME, Level=300)
+
+
+async def test_timeout():
+    async with MockCodec(latency=1) as codec:
+        async with xows.XoWSClient(codec.url, timeout=0.1) as client:
+            with pytest.raises(xows.RequestTimeout):
+                await client.xGet(VOLUME)
+            assert client.pending_count == 0
+
+
+async def test_timeout_override():
+    async with MockCodec(latency=0.2) as codec:
+        async with xows.XoWSClient(codec.url, timeout=0.05) as client:
+            assert await client.xGet(VOLUME, timeout=1) == 50
+
+
+async def test_queued_call_times_out():
+    async with MockCodec(latency=1) as codec:
+        async with xows.XoWSClient(codec.url, max_in_flight=1) as client:
+            slow = asyncio.ensure_future(client.xGet(VOLUME))
+            await asyncio.sleep(0.05)
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            with pytest.raises(xows.RequestTimeout):
+                await client.xGet(VOLUME, timeout=0.1)
+            with pytest.raises(xows.RequestTimeout):
+                await client.prepare('xGet', VOLUME)(timeout=0.1)
+            with pytest.raises(xows.RequestTimeout):
+                async for _ in client.leaves('xGet', timeout=0.1, Path=VOLUME):
+                    pass
+            assert loop.time() - start < 0.8
+            assert client.queued_count == 0
+            assert await slow == 50
+            assert await client.xGet(VOLUME) == 50
+
+
+async def test_queued_call_cancelled():
+    async with MockCodec(latency=0.2) as codec:
+        async with xows.XoWSClient(codec.url, max_in_flight=1) as client:
+            slow = asyncio.ensure_future(client.xGet(VOLUME))
+            await asyncio.sleep(0.05)
+            queued = asyncio.ensure_future(client.xGet(VOLUME))
+            await asyncio.sleep(0.05)
+            queued.cancel()
+            await asyncio.gather(queued, return_exceptions=True)
+            assert client.queued_count == 0
+            assert await slow == 50
+            assert client.pending_count == 0
+
+
+async def test_batch():
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            frames = record_frames(client)
+            async with client.batch() as batch:
+                volume = batch.xGet(VOLUME)
+                uptime = batch.xGet(['Status', 'SystemUnit', 'Uptime'])
+            assert await volume == 50
+            assert isinstance(await uptime, int)
+            assert len(frames) == 1 and len(frames[0]) == 2
+
+
+async def test_batch_error_cancels_calls():
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            with pytest.raises(KeyError):
+                async with client.batch(timeout=0.01) as batch:
+                    expired = batch.xGet(VOLUME)
+                    await asyncio.sleep(0.05)
+                    cancelled = batch.xGet(VOLUME)
+                    raise KeyError('oops')
+            assert isinstance(expired.exception(), xows.RequestTimeout)
+            assert cancelled.cancelled()
+            assert client.pending_count == 0
+
+
+async def test_coalesce_calls():
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url, coalesce=True) as client:
+            frames = record_frames(client)
+            results = await asyncio.gather(*(client.xGet(VOLUME) for _ in range(5)))
+            assert results == [50] * 5
+            assert len(frames) == 1 and len(frames[0]) == 5
+
+
+async def test_coalesce_feedback():
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            events = []
+            await client.subscribe(VOLUME, lambda data, _: events.append(data),
+                                   coalesce=0.1)
+            for level in range(10, 15):
+                await client.xCommand(SET_VOLUME, Level=level)
+            await asyncio.sleep(0.2)
+            assert events == [{'Status': {'Audio': {'Volume': 14}}}]
+            assert events[0].events == 5
+
+
+async def test_reconnect_replays_subscriptions():
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url, reconnect=True,
+                                   reconnect_delay=0.05) as client:
+            events = []
+            call = await client.subscribe(['Status', 'Call'], lambda data, _: None)
+            volume = await client.subscribe(VOLUME, lambda data, id_: events.append(id_))
+            await client.unsubscribe(call)
+            await codec.drop_connections()
+            for _ in range(100):
+                await asyncio.sleep(0.02)
+                if client.connected and client.reconnect_count:
+                    break
+            await asyncio.sleep(0.05)
+            assert client.reconnect_count == 1
+            await client.xCommand(SET_VOLUME, Level=20)
+            await asyncio.sleep(0.05)
+            assert events == [volume]
+            # The codec handed out a new Id, the old one is forgotten
+            assert len(client._feedback_handlers) == 1 # pylint: disable=protected-access
+
+
+async def test_connection_closed_fails_pending():
+    async with MockCodec(latency=1) as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            call = asyncio.ensure_future(client.xGet(VOLUME))
+            await asyncio.sleep(0.05)
+            await codec.drop_connections()
+            with pytest.raises(xows.ConnectionClosed):
+                await call
+
+
+async def test_dispatch_stats_before_connect():
+    client = xows.XoWSClient('localhost')
+    assert client.dispatch_stats['enqueued'] == 0
+    with pytest.raises(ValueError):
+        xows.XoWSClient('localhost', dispatch_overflow='nope')
+
+
+async def test_failed_reconnect_ends_streams():
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url, reconnect=True,
+                                   reconnect_delay=0.05) as client:
+            stream = client.feedback(VOLUME)
+            await stream.start()
+            codec.password = 'changed'
+            await codec.drop_connections()
+            assert [event async for event in stream] == []
+            with pytest.raises(xows.AuthenticationFailure):
+                await client.wait_until_closed()
+
+
+def test_star_import():
+    names = {}
+    exec('from xows import *', names) # pylint: disable=exec-used
+    assert names['XoWSClient'] is xows.XoWSClient
+    assert names['RequestTimeout'] is xows.RequestTimeout
+    assert set(xows.__all__) <= set(dir(xows))
+
+
+async def test_coalesced_handler_tasks_are_limited(caplog):
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url, max_handler_tasks=1) as client:
+            busy = asyncio.Event()
+            events = []
+
+            async def slow(data, _):
+                await busy.wait()
+
+            async def failing(data, _):
+                events.append(data)
+                raise KeyError('oops')
+
+            await client.subscribe(VOLUME, slow)
+            await client.subscribe(VOLUME, failing, coalesce=0.01)
+            await client.xCommand(SET_VOLUME, Level=20)
+            await asyncio.sleep(0.1)
+            # The slow handler holds the only slot
+            assert events == []
+            busy.set()
+            await asyncio.sleep(0.05)
+            assert events == [{'Status': {'Audio': {'Volume': 20}}}]
+            assert 'feedback handler failed' in caplog.text
+            assert not client._handler_tasks # pylint: disable=protected-access
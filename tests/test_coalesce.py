@@ -0,0 +1,49 @@
+import asyncio
+
+from xows import tree
+from xows.coalesce import Coalescer
+
+
+def call(id_, **values):
+    return {'Status': {'Call': [dict(id=id_, **values)]}}
+
+
+async def coalesce(*events):
+    delivered = []
+    coalescer = Coalescer(lambda data, _: delivered.append(data), 0.01)
+    for event in events:
+        coalescer(event, 0)
+    await asyncio.sleep(0.05)
+    assert len(delivered) == 1
+    return delivered[0]
+
+
+async def test_latest_value_wins():
+    event = await coalesce(call(5, Status='Dialling'), call(5, Status='Connected'))
+    assert event == call(5, Status='Connected')
+    assert event.events == 2 and event.collapsed == 1
+    assert event.counts[('Status', 'Call', 5, 'Status')] == 2
+
+
+async def test_removed_item():
+    event = await coalesce(call(5, Status='Connected'), call(5, ghost='True'))
+    assert event == call(5, ghost='True')
+
+
+async def test_removed_and_added_again():
+    event = await coalesce(call(5, Status='Connected'), call(5, ghost='True'),
+                           call(5, Status='Dialling'))
+    assert event == call(5, Status='Dialling')
+    state = {'Status': {'Call': [{'id': 5, 'Status': 'Connected'}]}}
+    assert tree.merge(state, event) == call(5, Status='Dialling')
+
+
+async def test_awaitable_failure_is_logged(caplog):
+    async def handler(data, _):
+        raise KeyError('oops')
+
+    coalescer = Coalescer(handler, 0.01)
+    coalescer(call(5, Status='Connected'), 0)
+    await asyncio.sleep(0.05)
+    assert 'coalesced feedback handler failed' in caplog.text
+    assert not coalescer._tasks # pylint: disable=protected-access
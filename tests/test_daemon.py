@@ -0,0 +1,78 @@
+import asyncio
+import functools
+import os
+
+import pytest
+
+import xows
+from xows import daemonclient
+from xows.daemon import Daemon
+from xows.testing import MockCodec
+
+
+VOLUME = ['Status', 'Audio', 'Volume']
+
+
+async def call(path, method, params, host):
+    return await asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(daemonclient.call, method, params, host, path=path))
+
+
+async def test_calls_reuse_connection(tmp_path):
+    path = str(tmp_path / 'xows.sock')
+    async with MockCodec() as codec:
+        async with Daemon(path) as daemon:
+            assert await call(path, 'xGet', {'Path': VOLUME}, codec.url) == 50
+            assert await call(path, 'xCommand/Audio/Volume/Set', {'Level': 20},
+                              codec.url) == {'status': 'OK'}
+            with pytest.raises(xows.InvalidParameter):
+                await call(path, 'xCommand/Audio/Volume/Set', {'Level': 200}, codec.url)
+            assert await call(path, 'xGet', {'Path': VOLUME}, codec.url) == 20
+            assert daemon.calls == 4
+            assert len(codec.connections) == 1
+        assert not os.path.exists(path)
+
+
+async def test_second_daemon_refused(tmp_path):
+    path = str(tmp_path / 'xows.sock')
+    async with Daemon(path):
+        with pytest.raises(OSError):
+            await Daemon(path).start()
+
+
+async def test_stale_socket_replaced(tmp_path):
+    path = str(tmp_path / 'xows.sock')
+    daemon = Daemon(path)
+    await daemon.start()
+    daemon._server.close() # pylint: disable=protected-access
+    await daemon._server.wait_closed() # pylint: disable=protected-access
+    async with Daemon(path):
+        daemonclient.check_socket(path)
+    await daemon.stop()
+
+
+def test_no_daemon(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        daemonclient.call('xGet', {'Path': VOLUME}, 'codec', path=str(tmp_path / 'none'))
+
+
+async def test_refuses_foreign_files(tmp_path):
+    path = tmp_path / 'xows.sock'
+    path.write_text('not a socket')
+    with pytest.raises(PermissionError):
+        daemonclient.call('xGet', {'Path': VOLUME}, 'codec', path=str(path))
+    with pytest.raises(PermissionError):
+        await Daemon(str(path)).start()
+
+
+async def test_private_fallback_dir(tmp_path, monkeypatch):
+    directory = tmp_path / 'xows-fallback'
+    monkeypatch.setattr(daemonclient, '_fallback_dir', lambda: str(directory))
+    path = str(directory / 'xows.sock')
+    async with Daemon(path):
+        assert os.stat(directory).st_mode & 0o777 == 0o700
+    os.chmod(directory, 0o755)
+    with pytest.raises(PermissionError):
+        await Daemon(path).start()
+    with pytest.raises(PermissionError):
+        daemonclient.check_socket(path)
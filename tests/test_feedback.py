@@ -0,0 +1,83 @@
+import asyncio
+
+import xows
+from xows.recording import Recorder, Recording, Replay
+from xows.testing import MockCodec
+
+
+VOLUME = ['Status', 'Audio', 'Volume']
+SET_VOLUME = ['Audio', 'Volume', 'Set']
+
+
+async def test_stream():
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            levels = []
+            async with client.feedback(VOLUME, notify_current_value=True) as stream:
+                async for event in stream:
+                    levels.append(event['Status']['Audio']['Volume'])
+                    if len(levels) == 3:
+                        break
+                    await client.xCommand(SET_VOLUME, Level=levels[-1] + 1)
+            assert levels == [50, 51, 52]
+            assert stream.id is None
+            assert codec.tree['Status']['Audio']['Volume'] == 52
+            assert not client._feedback_handlers # pylint: disable=protected-access
+
+
+async def test_stream_close_unsubscribes():
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            stream = client.feedback(VOLUME)
+            await stream.start()
+            assert sum(len(conn.subscriptions) for conn in codec.connections) == 1
+            await stream.aclose()
+            assert sum(len(conn.subscriptions) for conn in codec.connections) == 0
+            assert [event async for event in stream] == []
+
+
+async def test_stream_ends_on_disconnect():
+    async with MockCodec() as codec:
+        client = xows.XoWSClient(codec.url)
+        await client.connect()
+        stream = client.feedback(VOLUME)
+        await stream.start()
+        await client.xCommand(SET_VOLUME, Level=20)
+        await asyncio.sleep(0.05)
+        await client.disconnect()
+        events = [event async for event in stream]
+        assert events == [{'Status': {'Audio': {'Volume': 20}}}]
+
+
+async def record(directory):
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            recorder = Recorder(directory)
+            await recorder.attach(client, ['Status', 'Audio', '**'])
+            for level in range(10, 15):
+                await client.xCommand(SET_VOLUME, Level=level)
+            await asyncio.sleep(0.05)
+            recorder.close()
+
+
+async def test_replay_stream_close(tmp_path):
+    await record(str(tmp_path))
+    replay = Replay(Recording(str(tmp_path)), speed=None)
+    stream = xows.FeedbackStream(replay, VOLUME, overflow='drop-oldest')
+    await stream.start()
+    assert await replay.run() == 5
+    await stream.aclose()
+    events = [event async for event in stream]
+    assert len(events) == 5
+    assert not replay._subscriptions # pylint: disable=protected-access
+
+
+async def test_replay_coalesce(tmp_path):
+    await record(str(tmp_path))
+    replay = Replay(Recording(str(tmp_path)), speed=None)
+    events = []
+    await replay.subscribe(VOLUME, lambda data, _: events.append(data), coalesce=0.05)
+    await replay.run()
+    await asyncio.sleep(0.1)
+    assert events == [{'Status': {'Audio': {'Volume': 14}}}]
+    assert events[0].events == 5
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+import xows
+from xows import jsonstream, tree
+from xows.testing import MockCodec
+
+
+DOCUMENT = {
+    'Status': {
+        'Audio': {'Volume': 50, 'Name': 'say "{hi}" [\\]', 'Empty': {}, 'None': []},
+        'Call': [
+            {'Status': 'Connected', 'id': 3, 'Remote': {'Number': 'a@b'}},
+            {'id': 4, 'ghost': 'True'},
+        ],
+        'Ports': [1, 2.5, None, True, [3]],
+        'Names': ['ü', {'Key': 'value'}],
+    },
+}
+
+
+@pytest.mark.parametrize('patterns', [
+    None,
+    [['Status', 'Audio', 'Volume']],
+    [['Status', 'Call', '*', 'Remote', '**']],
+    [['Status', '*', '*', 'Status'], ['Status', 'Ports']],
+    [['Configuration', '**']],
+])
+def test_leaves_like_iter_leaves(patterns):
+    text = json.dumps(DOCUMENT, indent=1)
+    trie = None if patterns is None else tree.queries_trie(patterns)
+    expected = [(path, value) for path, value in tree.iter_leaves(DOCUMENT)
+                if trie is None or trie.match(path)]
+    assert list(jsonstream.leaves(text, trie=trie)) == expected
+
+
+def test_prefix_and_position():
+    text = 'xx {"Volume": 50}'
+    assert list(jsonstream.leaves(text, 3, ('Status', 'Audio'))) == [
+        (('Status', 'Audio', 'Volume'), 50)]
+
+
+def test_skip():
+    text = '  {"a": "}]", "b": [1, {"c": "\\"{"}]} tail'
+    assert text[jsonstream.skip(text, 0):] == ' tail'
+    assert jsonstream.skip('12, 3', 0) == 2
+    with pytest.raises(ValueError):
+        jsonstream.skip('{"a": [1, 2}', 0)
+
+
+def test_response_spans():
+    text = '{"jsonrpc": "2.0", "result": {"Big": [1, 2]}, "id": 7}'
+    spans = jsonstream.response_spans(text, {7})
+    assert json.loads(text[slice(*spans['result'])]) == {'Big': [1, 2]}
+    assert jsonstream.response_spans(text, {8}) is None
+    assert jsonstream.response_spans('[]', {7}) is None
+
+
+async def test_client_leaves():
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            leaves = [leaf async for leaf in client.leaves(
+                'xQuery', [['Status', 'Audio', 'Volume']], Query=['Status', '**'])]
+            assert leaves == [(('Status', 'Audio', 'Volume'), 50)]
+            leaves = dict([leaf async for leaf in client.leaves(
+                'xGet', Path=['Status', 'Audio'])])
+            assert leaves[('Status', 'Audio', 'Volume')] == 50
+            with pytest.raises(xows.XoWSError):
+                async for _ in client.leaves('xGet', Path=['Status', 'Nope']):
+                    pass
@@ -0,0 +1,17 @@
+import asyncio
+
+import xows
+from xows.testing import MockCodec
+
+
+async def test_bytes_are_utf8_bytes():
+    async with MockCodec() as codec:
+        metrics = xows.Metrics()
+        async with xows.XoWSClient(codec.url, metrics=metrics) as client:
+            frame = '{"jsonrpc": "2.0", "method": "xGet", "id": 0, "params": {"Path": ["Æøå"]}}'
+            await client.send(frame)
+            await asyncio.sleep(0.05)
+            assert metrics.frames_sent[client.host] == 1
+            assert metrics.bytes_sent[client.host] == len(frame) + 3
+            assert metrics.frames_received[client.host] == 1
+            assert 'xows_bytes_sent_total' in metrics.prometheus()
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+import xows
+from xows.testing import MockCodec
+
+
+VOLUME = ['Status', 'Audio', 'Volume']
+SET_VOLUME = ['Audio', 'Volume', 'Set']
+
+
+async def test_mirror_follows_feedback():
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            mirror = await client.mirror([['Status', 'Audio', '**']])
+            assert mirror.get(VOLUME) == 50
+            await client.xCommand(SET_VOLUME, Level=20)
+            await asyncio.sleep(0.05)
+            requests = codec.requests
+            assert await client.xGet(VOLUME) == 20
+            assert codec.requests == requests
+
+
+async def test_refresh_corrects_drift():
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            mirror = await client.mirror([['Status', 'Audio', '**']])
+            mirror.tree['Status']['Audio']['Volume'] = 99
+            mirror.tree['Status']['Audio']['Gone'] = True
+            await mirror.refresh()
+            assert mirror.get(VOLUME) == 50
+            assert 'Gone' not in mirror.tree['Status']['Audio']
+
+
+async def test_feedback_during_refresh_wins():
+    async with MockCodec(latency=0.2) as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            mirror = await client.mirror([['Status', 'Audio', '**']])
+            refresh = asyncio.ensure_future(mirror.refresh())
+            await asyncio.sleep(0.01)
+            await client.xCommand(SET_VOLUME, Level=20)
+            await refresh
+            assert mirror.get(VOLUME) == 20
+
+
+async def test_stale_mirror_is_refreshed():
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            mirror = await client.mirror([['Status', 'Audio', '**']])
+            mirror.invalidate()
+            assert mirror.stale
+            assert await client.xGet(VOLUME) == 50
+            assert not mirror.stale
+
+
+async def test_lost_connection_invalidates_mirror():
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            mirror = await client.mirror([['Status', 'Audio', '**']])
+            await codec.drop_connections()
+            await client.wait_until_closed()
+            assert mirror.stale
+            with pytest.raises(xows.ConnectionClosed):
+                await client.xGet(VOLUME)
@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from xows.overflow import OverflowQueue
+
+
+async def drain(queue):
+    return [queue.get_nowait() for _ in range(queue.qsize())]
+
+
+async def test_drop_newest():
+    queue = OverflowQueue(2, 'drop-newest')
+    assert [queue.offer(item) for item in range(4)] == [True, True, False, False]
+    assert await drain(queue) == [0, 1]
+    assert queue.enqueued == 2 and queue.dropped == 2
+
+
+async def test_drop_oldest():
+    queue = OverflowQueue(2, 'drop-oldest')
+    assert [queue.offer(item) for item in range(4)] == [True, True, False, False]
+    assert await drain(queue) == [2, 3]
+    assert queue.enqueued == 4 and queue.dropped == 2
+
+
+async def test_block():
+    queue = OverflowQueue(1, 'block')
+    await queue.push(0)
+    with pytest.raises(asyncio.QueueFull):
+        queue.offer(1)
+    pushing = asyncio.ensure_future(queue.push(1))
+    await asyncio.sleep(0.01)
+    assert not pushing.done()
+    assert queue.get_nowait() == 0
+    await pushing
+    assert await drain(queue) == [1]
+    assert queue.enqueued == 2 and queue.dropped == 0
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        OverflowQueue(1, 'drop-random')
@@ -0,0 +1,55 @@
+import asyncio
+
+import xows
+from xows.router import EventRouter
+from xows.testing import MockCodec
+
+
+SET_VOLUME = ['Audio', 'Volume', 'Set']
+
+
+class EventsFirstCodec(MockCodec):
+    'Sends NotifyCurrentValue feedback before the subscribe response.'
+
+    async def _respond(self, conn, request, delay):
+        response, after = await self._call(conn, request)
+        if after:
+            await after()
+        await self._send(conn, response)
+
+
+async def test_routes():
+    async with MockCodec() as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            volume, anything, calls = [], [], []
+            async with EventRouter(client) as router:
+                router.add(['Status', 'Audio', 'Volume'], lambda data, _: volume.append(data))
+                router.add(['Status', '**'], lambda data, _: anything.append(data))
+                calls_id = router.add(['Status', 'Call', '*', 'Status'],
+                                      lambda data, _: calls.append(data))
+                await client.xCommand(SET_VOLUME, Level=20)
+                router.remove(calls_id)
+                await codec.update({'Status': {'Call': [{'id': 1, 'Status': 'Connected'}]}})
+                await asyncio.sleep(0.05)
+            assert volume == [{'Status': {'Audio': {'Volume': 20}}}]
+            assert len(anything) == 2
+            assert calls == []
+            assert sum(len(conn.subscriptions) for conn in codec.connections) == 0
+
+
+async def test_events_before_subscribe_response():
+    async with EventsFirstCodec() as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            events = []
+            router = EventRouter(client, ['Status', 'Audio', '**'],
+                                 notify_current_value=True)
+            router.add(['Status', 'Audio', 'Volume'], lambda data, _: events.append(data))
+            await router.start()
+            await asyncio.sleep(0.05)
+            # The full event, as routed handlers get it
+            assert len(events) == 1
+            assert events[0]['Status']['Audio']['Volume'] == 50
+            await client.xCommand(SET_VOLUME, Level=20)
+            await asyncio.sleep(0.05)
+            assert events[-1] == {'Status': {'Audio': {'Volume': 20}}}
+            assert not client._early_events # pylint: disable=protected-access
@@ -0,0 +1,66 @@
+import asyncio
+
+import xows
+from xows.scheduler import BULK, INTERACTIVE, NORMAL, SendScheduler, default_priority
+from xows.testing import MockCodec
+
+
+def test_default_priority():
+    assert default_priority('xCommand/Audio/Volume/Set') == INTERACTIVE
+    assert default_priority('xSet') == INTERACTIVE
+    assert default_priority('xFeedback/Subscribe') == NORMAL
+    assert default_priority('xQuery') == BULK
+
+
+async def test_priority_order():
+    scheduler = SendScheduler(1)
+    await scheduler.acquire([0], NORMAL)
+    order = []
+
+    async def call(id_, priority):
+        await scheduler.acquire([id_], priority)
+        order.append(id_)
+        scheduler.release(id_)
+
+    tasks = [asyncio.ensure_future(call(1, BULK)),
+             asyncio.ensure_future(call(2, NORMAL)),
+             asyncio.ensure_future(call(3, INTERACTIVE)),
+             asyncio.ensure_future(call(4, BULK))]
+    await asyncio.sleep(0)
+    assert scheduler.queued == 4
+    scheduler.release(0)
+    await asyncio.gather(*tasks)
+    assert order == [3, 2, 1, 4]
+    assert scheduler.in_flight == 0 and scheduler.queued == 0
+
+
+async def test_abandoned_waiter_passes_slot_on():
+    scheduler = SendScheduler(1)
+    await scheduler.acquire([0], NORMAL)
+    call = asyncio.get_running_loop().create_future()
+    abandoned = asyncio.ensure_future(scheduler.acquire([1], INTERACTIVE, [call]))
+    waiting = asyncio.ensure_future(scheduler.acquire([2], BULK))
+    await asyncio.sleep(0)
+    call.set_exception(xows.RequestTimeout())
+    assert await abandoned is False
+    scheduler.release(0)
+    assert await waiting is True
+    assert scheduler.in_flight == 1 and scheduler.queued == 0
+
+
+async def test_commands_overtake_queued_queries():
+    async with MockCodec(latency=0.05) as codec:
+        async with xows.XoWSClient(codec.url, max_in_flight=1) as client:
+            sent = []
+            send = client.send
+
+            async def recording(message):
+                sent.append(message['method'])
+                await send(message)
+
+            client.send = recording
+            await asyncio.gather(
+                client.xGet(['Status', 'Audio', 'Volume']),
+                client.xQuery(['Status', '**']),
+                client.xCommand(['Audio', 'Volume', 'Set'], Level=20))
+            assert sent == ['xGet', 'xCommand/Audio/Volume/Set', 'xQuery']
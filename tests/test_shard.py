@@ -0,0 +1,99 @@
+import asyncio
+import os
+import signal
+
+import xows
+from xows.shard import _Worker
+from xows.testing import MockCodec
+
+
+VOLUME = ['Status', 'Audio', 'Volume']
+SET_VOLUME = ['Audio', 'Volume', 'Set']
+
+
+async def test_slow_handler_spares_worker():
+    async with MockCodec() as codec:
+        events = []
+
+        async def slow(host, data):
+            events.append(data)
+            await asyncio.sleep(1)
+
+        async with xows.ShardedFleet([codec.url], processes=1, heartbeat=0.1) as fleet:
+            fleet.heartbeat_timeout = 0.5
+            await fleet.subscribe(VOLUME, slow)
+            await asyncio.sleep(0.3)
+            for level in (10, 20):
+                async for res in fleet.xCommand(SET_VOLUME, Level=level):
+                    assert res.error is None
+            await asyncio.sleep(1.5)
+            assert fleet.restarts == 0
+            assert len(events) == 2
+            assert fleet.worker_stats()[0]['silent'] < 0.5
+
+
+async def test_worker_outbox_is_bounded():
+    worker = _Worker(None, 'admin', '', heartbeat=1, batch_interval=0,
+                     outbox_maxsize=3, fleet_options={})
+    worker._wake = asyncio.Event() # pylint: disable=protected-access
+    for level in range(5):
+        worker._event(0, 'codec', {'Volume': level}, 0) # pylint: disable=protected-access
+    assert len(worker._outbox) == 3 # pylint: disable=protected-access
+    assert worker._dropped == 2 # pylint: disable=protected-access
+
+
+async def wait_for(condition, timeout=10):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition() and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.05)
+    return condition()
+
+
+async def test_calls_and_feedback():
+    async with MockCodec() as codec:
+        hosts = [codec.url + f'?{n}' for n in range(4)]
+        events = []
+        async with xows.ShardedFleet(hosts, processes=2) as fleet:
+            assert not fleet.failed
+            assert sorted(stats['hosts'] for stats in fleet.worker_stats()) == [2, 2]
+            await fleet.subscribe(VOLUME, lambda host, data: events.append(host))
+            await asyncio.sleep(0.3)
+            results = [res async for res in fleet.xCommand(SET_VOLUME, [hosts[0]], Level=20)]
+            assert [(res.host, res.error) for res in results] == [(hosts[0], None)]
+            assert await wait_for(lambda: len(events) == 4)
+            results = [res async for res in fleet.xGet(VOLUME)]
+            assert sorted(res.host for res in results) == sorted(hosts)
+            assert {res.result for res in results} == {20}
+
+
+async def test_dead_worker_is_replaced():
+    async with MockCodec() as codec:
+        hosts = [codec.url + f'?{n}' for n in range(4)]
+        events = []
+        async with xows.ShardedFleet(hosts, processes=2, heartbeat=0.1) as fleet:
+            await fleet.subscribe(VOLUME, lambda host, data: events.append(host))
+            pid = fleet.worker_stats()[0]['pid']
+            os.kill(pid, signal.SIGKILL)
+            assert await wait_for(lambda: fleet.restarts == 1 and all(
+                stats['connected'] == 2 for stats in fleet.worker_stats()))
+            assert pid not in [stats['pid'] for stats in fleet.worker_stats()]
+            results = [res async for res in fleet.xGet(VOLUME)]
+            assert all(res.error is None for res in results) and len(results) == 4
+            # Moved hosts were subscribed again
+            await codec.update({'Status': {'Audio': {'Volume': 30}}})
+            assert await wait_for(lambda: len(events) == 4)
+
+
+async def test_hung_worker_is_killed():
+    async with MockCodec() as codec:
+        hosts = [codec.url + f'?{n}' for n in range(2)]
+        async with xows.ShardedFleet(hosts, processes=2, heartbeat=0.1,
+                                     max_restarts=0) as fleet:
+            # Spawning workers takes longer than that
+            fleet.heartbeat_timeout = 0.5
+            pid = fleet.worker_stats()[0]['pid']
+            os.kill(pid, signal.SIGSTOP)
+            assert await wait_for(lambda: len(fleet.worker_stats()) == 1)
+            # Without restarts left, the survivor takes over the hosts
+            assert await wait_for(lambda: fleet.worker_stats()[0]['connected'] == 2)
+            assert fleet.restarts == 0
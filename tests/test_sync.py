@@ -0,0 +1,41 @@
+import logging
+import queue
+import time
+
+import xows
+from xows.testing import MockCodec
+
+
+VOLUME = ['Status', 'Audio', 'Volume']
+SET_VOLUME = ['Audio', 'Volume', 'Set']
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_sync_client(caplog):
+    with xows.SyncClient() as codecs:
+        codec = MockCodec()
+        codecs.run(codec.start())
+        try:
+            assert codecs.xGet(codec.url, VOLUME) == 50
+
+            events = queue.Queue(maxsize=2)
+            codecs.subscribe(codec.url, VOLUME, events)
+            for level in range(10, 15):
+                codecs.xCommand(codec.url, SET_VOLUME, Level=level)
+            assert wait_for(lambda: codecs.dropped == 3)
+            assert events.get_nowait()[0] == {'Status': {'Audio': {'Volume': 10}}}
+
+            def failing(data, id_):
+                raise RuntimeError('handler bug')
+            with caplog.at_level(logging.ERROR, logger='xows.sync'):
+                codecs.subscribe(codec.url, VOLUME, failing)
+                codecs.xCommand(codec.url, SET_VOLUME, Level=20)
+                assert wait_for(lambda: 'feedback handler failed' in caplog.text)
+        finally:
+            codecs.run(codec.stop())
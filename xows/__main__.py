@@ -1,29 +1,224 @@
 #!/usr/bin/env python3
 
-"Command-line tool based on pyxows."
+"""Command-line tool based on pyxows.
 
+Kept quick to start: asyncio, aiohttp, json and pprint are only imported
+once a command actually runs, not for --help or usage errors."""
 
-import asyncio
+# pylint: disable=import-outside-toplevel
+
+import collections
 import functools
-import pprint
+import sys
 
 import click
 
 import xows
 
 
+Target = collections.namedtuple('Target',
+                                'fleet hosts username password daemon schema connect')
+Target.__doc__ = '''What the cli group arguments select. connect() returns
+an XoWSClient for hosts[0], or an XoWSFleet for hosts if fleet is True.
+daemon is False with --no-daemon, schema with --no-schema.'''
+
+
 def wrap_cli(fun):
     'Wraps calls in an async with XoWSClient + async.run'
 
     async def wrapper(obj, *args, **kwargs):
         async with obj as client:
             await fun(client, *args, **kwargs)
-    def run_wrapper(*args, **kwargs):
-        asyncio.run(wrapper(*args, **kwargs))
+    def run_wrapper(target, *args, **kwargs):
+        if target.fleet:
+            raise click.UsageError(f'{fun.__name__} does not support --hosts-file')
+        import asyncio
+        asyncio.run(wrapper(target.connect(), *args, **kwargs))
 
     return functools.update_wrapper(run_wrapper, fun)
 
 
+def wrap_call(fun):
+    '''Wraps commands returning a call, i.e. a (method, params) tuple, or
+    None for nothing to do. The call's result is pretty printed, or with
+    --hosts-file run on every host and printed as one NDJSON line per host.
+
+    A single host call goes through clixows daemon if one is running.'''
+
+    async def wrapper(target, method, params):
+        def call(client):
+            return client.api_call(method, **params)
+        if target.fleet:
+            await run_fleet(target.connect(), call)
+        else:
+            async with target.connect() as client:
+                return await call(client)
+        return None
+    def run_wrapper(target, *args, **kwargs):
+        call = fun(*args, **kwargs)
+        if call is None:
+            return
+        method, params = call
+        if target.schema and not target.fleet:
+            check_schema(target.hosts[0], method, params)
+        if target.daemon and not target.fleet:
+            from xows import daemonclient
+            try:
+                result = daemonclient.call(method, params, target.hosts[0],
+                                           target.username, target.password)
+            except (FileNotFoundError, ConnectionRefusedError):
+                pass # No daemon running
+            except PermissionError as err:
+                print(f'Not using daemon: {err}', file=sys.stderr)
+            else:
+                import pprint
+                pprint.pprint(result)
+                return
+        import asyncio
+        result = asyncio.run(wrapper(target, method, params))
+        if not target.fleet:
+            import pprint
+            pprint.pprint(result)
+
+    return functools.update_wrapper(run_wrapper, fun)
+
+
+def check_schema(host, method, params):
+    '''Validates a call against the cached schema of host, if any, see
+    clixows schema. The cache may predate a software upgrade, so the error
+    says how to refresh it or skip the check.'''
+    from xows import XoWSError
+    from xows.schema import SchemaCache
+    schema = SchemaCache().host_schema(host)
+    if schema is None:
+        return
+    try:
+        if method.startswith('xCommand/'):
+            schema.validate_command(method.split('/')[1:], params)
+        elif method == 'xSet':
+            schema.validate_set(params['Path'], params['Value'])
+    except XoWSError as err:
+        raise click.ClickException(
+            f'{err} (cached schema {schema.version}; if the codec was upgraded, '
+            f'run "clixows {host} schema" to refresh it, or pass --no-schema)') from None
+
+
+def complete_command(ctx, _param, incomplete):
+    '''Shell completion for command, from the cached schema of the host.'''
+    from xows.schema import SchemaCache
+    host = ctx.parent.params.get('host_or_url') if ctx.parent else None
+    schema = SchemaCache().host_schema(host) if host else None
+    if schema is None:
+        return []
+    return schema.complete_command(list(ctx.params.get('params') or ()) + [incomplete])
+
+
+async def run_fleet(fleet, call):
+    '''Runs call on every host in fleet, writing a JSON line per host as
+    soon as it is done. Failed hosts get an error line instead of a result.
+    How long connecting took is reported on stderr.'''
+
+    import json
+    try:
+        async for res in fleet.map(call):
+            line = {'host': res.host}
+            if res.error is None:
+                line['result'] = res.result
+            else:
+                line['error'] = {'type': type(res.error).__name__,
+                                 'message': str(res.error)}
+            sys.stdout.write(json.dumps(line, default=str) + '\n')
+            sys.stdout.flush()
+        stats = fleet.connect_stats()
+        print(f"connected {stats['connected']}/{len(fleet.hosts)} hosts in "
+              f"{stats['seconds']:.1f} s, {stats['retried']} retries, "
+              f"{stats['rate_limited']} rate limited", file=sys.stderr)
+    finally:
+        await fleet.disconnect()
+
+
+def read_hosts(lines):
+    'Hosts from lines, skipping blank lines and # comments.'
+    hosts = []
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if line:
+            hosts.append(line)
+    return hosts
+
+
+def silence_stdout():
+    '''Points stdout at /dev/null once its reader is gone, e.g. after
+    `| head`, so exiting doesn't complain about unflushed output.'''
+    import os
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    os.close(devnull)
+
+
+class LineWriter:
+    '''Buffers lines for stream, writing them out once lines lines are
+    buffered or interval seconds after the first buffered line, whichever
+    comes first. Call flush() when done. Must be created in the event loop.
+
+    If the reader of stream goes away, lines are dropped from then on and
+    on_broken_pipe is called once.'''
+
+    def __init__(self, stream, interval=0.5, lines=1000, on_broken_pipe=None):
+        import asyncio
+        self._loop = asyncio.get_running_loop()
+        self._stream = stream
+        self._interval = interval
+        self._lines = lines
+        self._on_broken_pipe = on_broken_pipe
+        self._buffer = []
+        self._timer = None
+        self.broken = False
+
+    def write(self, line):
+        'Buffers line, which must end with a newline.'
+        if self.broken:
+            return
+        self._buffer.append(line)
+        if len(self._buffer) >= self._lines:
+            self.flush()
+        elif self._timer is None:
+            self._timer = self._loop.call_later(self._interval, self.flush)
+
+    def flush(self):
+        'Writes out all buffered lines.'
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._buffer:
+            try:
+                self._stream.write(''.join(self._buffer))
+                self._stream.flush()
+            except BrokenPipeError:
+                self.broken = True
+                if self._on_broken_pipe is not None:
+                    self._on_broken_pipe()
+            finally:
+                self._buffer.clear()
+
+
+class HostsGroup(click.Group):
+    '''Group with an optional host_or_url argument, left out with
+    --hosts-file and for daemon.'''
+
+    def parse_args(self, ctx, args):
+        takes_value = {name for param in self.params
+                       if isinstance(param, click.Option) and not param.is_flag
+                       for name in param.opts}
+        pos = 0
+        while pos < len(args) and args[pos].startswith('-'):
+            pos += 2 if args[pos] in takes_value else 1
+        if pos < len(args) and args[pos] in self.commands:
+            # No host_or_url given, mark its place before the subcommand
+            args = args[:pos] + [''] + args[pos:]
+        return super().parse_args(ctx, args)
+
+
 def _coerce_list(path):
     ret = []
     for part in path:
@@ -47,15 +242,35 @@ def coerce_list(arg_name):
     return coerced
 
 
-@click.group()
+@click.group(cls=HostsGroup)
 @click.version_option(xows.__version__)
-@click.argument('host_or_url',)
+@click.argument('host_or_url', required=False)
+@click.option('--hosts-file', type=click.File('r'),
+              help='Run on every host in this file, one per line, - for stdin.')
+@click.option('--concurrency', default=50, show_default=True,
+              help='Max hosts connecting or running at once with --hosts-file.')
+@click.option('--connect-rate', type=float, default=None,
+              help='Max connects started per second with --hosts-file.')
 @click.option('-u', '--username', default='admin', show_default=True)
 @click.option('-p', '--password', default='', show_default=True)
+@click.option('--max-in-flight', type=int, default=None,
+              help='Max calls awaiting a response, queue the rest.')
+@click.option('--no-daemon', is_flag=True,
+              help="Connect directly even if clixows daemon is running.")
+@click.option('--no-schema', is_flag=True,
+              help="Don't check command and set against the cached schema.")
 @click.pass_context
-def cli(ctx, host_or_url, username, password):
+def cli(ctx, host_or_url, username, password, max_in_flight, hosts_file,
+        concurrency, connect_rate, no_daemon, no_schema):
     """First argument is hostname, or url (e.g. ws://example.host/ws)
 
+    With --hosts-file instead, get, query, set and command run on all hosts
+    in parallel and print one JSON line per host as it completes, holding
+    either "result" or "error".
+
+    While clixows daemon runs, get, query, set and command reuse its open
+    connection to the host instead of connecting, see daemon --help.
+
     Usage examples:
 
     clixows ws://example.codec/ws get Status SystemUnit Uptime
@@ -65,9 +280,31 @@ def cli(ctx, host_or_url, username, password):
     clixows example.codec command Phonebook Search Limit=1 Offset=0
 
     clixows example.codec feedback -c '**'
+
+    clixows --hosts-file codecs.txt --concurrency 200 get Status SystemUnit Uptime
+
+    clixows --hosts-file codecs.txt --connect-rate 50 get Status SystemUnit Uptime
+
+    clixows daemon &
     """
 
-    ctx.obj = xows.XoWSClient(host_or_url, username, password)
+    # Deferred, so that subcommand --help doesn't import aiohttp
+    if hosts_file is not None:
+        if host_or_url:
+            raise click.UsageError('Give either HOST_OR_URL or --hosts-file')
+        hosts = read_hosts(hosts_file)
+        ctx.obj = Target(True, hosts, username, password, False, False, lambda: xows.XoWSFleet(
+            hosts, username, password, max_calls=concurrency,
+            admission=xows.ConnectAdmission(concurrency, rate=connect_rate)))
+    elif host_or_url:
+        ctx.obj = Target(False, [host_or_url], username, password, not no_daemon,
+                         not no_schema,
+                         lambda: xows.XoWSClient(host_or_url, username, password,
+                                                 max_in_flight=max_in_flight))
+    elif ctx.invoked_subcommand == 'daemon':
+        ctx.obj = Target(False, [], username, password, False, False, None)
+    else:
+        raise click.UsageError('Missing argument HOST_OR_URL')
 
 
 @cli.command()
@@ -76,6 +313,8 @@ def cli(ctx, host_or_url, username, password):
 async def demo(client):
     "Runs a quick demo, read source to see possibilities here."
 
+    import asyncio
+
     def callback(data, id_):
         print(f'Ultrasound change, Id = {id_}: {data}')
 
@@ -111,38 +350,38 @@ async def demo(client):
 @click.argument('path', nargs=-1)
 @coerce_list('path')
 @click.pass_obj
-@wrap_cli
-async def get(client, path):
+@wrap_call
+def get(path):
     "Get data from a config/status path."
 
-    pprint.pprint(await client.xGet(path))
+    return 'xGet', {'Path': path}
 
 @cli.command()
 @click.argument('query', nargs=-1)
 @coerce_list('query')
 @click.pass_obj
-@wrap_cli
-async def query(client, query):
+@wrap_call
+def query(query):
     "Query config/status docs. Supports '**' as wildcard."
 
-    pprint.pprint(await client.xQuery(query))
+    return 'xQuery', {'Query': query}
 
 @cli.command()
 @click.argument('path', nargs=-1)
 @coerce_list('path')
 @click.argument('value')
 @click.pass_obj
-@wrap_cli
-async def set(client, path, value):
+@wrap_call
+def set(path, value):
     "Set a single configuration."
 
-    pprint.pprint(await client.xSet(path, value))
+    return 'xSet', {'Path': path, 'Value': value}
 
 @cli.command()
-@click.argument('params', nargs=-1)
+@click.argument('params', nargs=-1, shell_complete=complete_command)
 @click.pass_obj
-@wrap_cli
-async def command(client, params):
+@wrap_call
+def command(params):
     "Run a command. Example: command Phonebook Search Limit=1"
 
     command = []
@@ -156,24 +395,125 @@ async def command(client, params):
         params = dict(param.split('=', 1) for param in params)
     except ValueError:
         print('Command arguments must contain "="')
-    else:
-        pprint.pprint(await client.xCommand(command, **params))
+        return None
+    return 'xCommand/' + '/'.join(map(str, command)), params
 
 @cli.command()
 @click.argument('query', nargs=-1)
 @coerce_list('query')
 @click.option('-c', '--current-value/--no-current-value', default=False, show_default=True)
+@click.option('-f', '--format', 'format_', type=click.Choice(['pprint', 'ndjson']),
+              default='pprint', show_default=True,
+              help='ndjson prints one JSON object per event with "id", '
+              '"mono" (monotonic clock) and "time" (epoch seconds) timestamps '
+              'and the "event", buffered for throughput.')
+@click.option('--flush-interval', default=0.5, show_default=True,
+              help='With ndjson, max seconds an event waits in the buffer.')
+@click.option('--flush-lines', default=1000, show_default=True,
+              help='With ndjson, max events buffered before writing.')
 @click.pass_obj
 @wrap_cli
-async def feedback(client, query, current_value):
+async def feedback(client, query, current_value, format_, flush_interval,
+                   flush_lines):
     "Listen for feedback on a particular query."
 
-    def handler(feedback, id_):
-        pprint.pprint(feedback)
+    import asyncio
+
+    def reader_gone():
+        # Stop quietly, like other tools writing to a closed pipe
+        silence_stdout()
+        asyncio.ensure_future(client.disconnect())
+
+    if format_ == 'pprint':
+        import pprint
+        broken = False
+
+        def handler(feedback, id_):
+            nonlocal broken
+            if broken:
+                return
+            try:
+                pprint.pprint(feedback)
+            except BrokenPipeError:
+                broken = True
+                reader_gone()
+
+        print('Subscription Id:', await client.subscribe(query, handler, current_value))
+
+        await client.wait_until_closed()
+        return
+
+    import time
+    writer = LineWriter(sys.stdout, flush_interval, flush_lines, reader_gone)
+    dumps = client.json_backend.dumps
+    monotonic = time.monotonic
+    wall = time.time
+
+    def ndjson_handler(feedback, id_):
+        writer.write(dumps({'id': id_, 'mono': monotonic(), 'time': wall(),
+                            'event': feedback}) + '\n')
+
+    await client.subscribe(query, ndjson_handler, current_value)
+    try:
+        await client.wait_until_closed()
+    finally:
+        writer.flush()
+
+@cli.command()
+@click.pass_obj
+@wrap_cli
+async def schema(client):
+    """Fetch and cache the codec's command and configuration schema.
 
-    print('Subscription Id:', await client.subscribe(query, handler, current_value))
+    Once cached, command and set are checked locally before sending and
+    command gets shell completion, e.g. in bash:
+    eval "$(_CLIXOWS_COMPLETE=bash_source clixows)". Fetched once per
+    software version.
+    """
+
+    from xows.schema import SchemaCache
+    cached = await SchemaCache().get(client)
+    print(f'Schema for {cached.version} cached')
 
-    await client.wait_until_closed()
+@cli.command()
+@click.option('--socket', 'path', default=None,
+              help='Unix socket to listen on. Default $XOWS_DAEMON_SOCKET, '
+              'else $XDG_RUNTIME_DIR/xows.sock, else /tmp/xows-<uid>/xows.sock.')
+@click.option('--idle-timeout', default=300.0, show_default=True,
+              help='Disconnect hosts unused for this many seconds.')
+@click.pass_obj
+def daemon(target, path, idle_timeout):
+    """Keep codec connections open for other clixows calls.
+
+    Hosts given as HOST_OR_URL or with --hosts-file are connected at start,
+    others on first use. Single host get, query, set and command calls use
+    the daemon while it runs; point them at a non-default --socket with
+    $XOWS_DAEMON_SOCKET.
+    """
+
+    import asyncio
+    import logging
+    import signal
+    from xows.daemon import Daemon
+
+    logging.basicConfig(level=logging.INFO)
+
+    async def run():
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, asyncio.current_task().cancel)
+        async with Daemon(path, idle_timeout) as server:
+            results = await asyncio.gather(
+                *(server.connect(host, target.username, target.password)
+                  for host in target.hosts), return_exceptions=True)
+            for host, result in zip(target.hosts, results):
+                if isinstance(result, Exception):
+                    print(f'{host}: {result!r}', file=sys.stderr)
+            print(f'Listening on {server.path}', file=sys.stderr)
+            await server.serve_forever()
+    try:
+        asyncio.run(run())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
 
 if __name__ == '__main__':
     cli()
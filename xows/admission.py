@@ -0,0 +1,121 @@
+'''Admission control for connects, so a fleet (re)start doesn't turn into a
+connect storm that codecs and proxies answer with 503 and 502.'''
+
+
+import asyncio
+import random
+import time
+
+from . import ProxyError, RateLimitError
+
+
+class ConnectAdmission:
+    '''Shared by many XoWSClient (see its admission parameter) to pace their
+    connects: at most max_concurrent connects run at once, and at most rate
+    start per second, with bursts of up to burst (default rate, at least 1).
+    None means no rate limit.
+
+    connect() additionally delays the first attempt by a random 0..jitter
+    seconds, and retries RateLimitError and ProxyError up to retries times,
+    waiting for Retry-After if the codec sent it, else with jittered
+    exponential backoff from retry_delay up to max_retry_delay seconds.
+
+    stats() tells how long getting everything connected took.'''
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, max_concurrent=50, rate=None, burst=None, jitter=0.0,
+                 retries=3, retry_delay=1.0, max_retry_delay=30.0):
+        self.max_concurrent = max_concurrent
+        self.rate = rate
+        self.burst = burst or (max(1.0, rate) if rate else None)
+        self.jitter = jitter
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._slots = None
+        self._tokens = self.burst
+        self._refilled = None
+        self._lock = None
+        self._first = self._last = None
+        self.attempts = self.connected = self.failed = 0
+        self.retried = self.rate_limited = 0
+        self.waited = 0.0
+
+    async def _take_token(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if self._refilled is not None:
+                    self._tokens = min(self.burst, self._tokens
+                                       + (now - self._refilled) * self.rate)
+                self._refilled = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def admit(self, open_):
+        '''Waits for a slot and, with a rate, a token, then returns await
+        open_(). No retries, for callers that retry themselves.'''
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+            self._lock = asyncio.Lock()
+        start = time.monotonic()
+        if self._first is None:
+            self._first = start
+        async with self._slots:
+            if self.rate:
+                await self._take_token()
+            self.waited += time.monotonic() - start
+            self.attempts += 1
+            try:
+                return await open_()
+            finally:
+                self._last = time.monotonic()
+
+    def _backoff(self, attempt, error):
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.retry_delay)
+        delay = min(self.max_retry_delay, self.retry_delay * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    async def connect(self, open_):
+        '''Runs await open_() like admit(), after the start jitter and with
+        retries, and returns its result.'''
+        if self.jitter:
+            await asyncio.sleep(random.uniform(0, self.jitter))
+        attempt = 0
+        while True:
+            try:
+                ret = await self.admit(open_)
+            except (RateLimitError, ProxyError) as err:
+                if isinstance(err, RateLimitError):
+                    self.rate_limited += 1
+                if attempt >= self.retries:
+                    self.failed += 1
+                    raise
+                await asyncio.sleep(self._backoff(attempt, err))
+                attempt += 1
+                self.retried += 1
+                continue
+            except BaseException:
+                self.failed += 1
+                raise
+            self.connected += 1
+            return ret
+
+    def stats(self):
+        '''Returns connects that succeeded and failed, attempts made, retries,
+        rate limited attempts, total seconds spent waiting for admission and
+        seconds from the first connect starting to the last one finishing.'''
+        return {
+            'connected': self.connected,
+            'failed': self.failed,
+            'attempts': self.attempts,
+            'retried': self.retried,
+            'rate_limited': self.rate_limited,
+            'waited': round(self.waited, 3),
+            'seconds': round(self._last - self._first, 3) if self._last else 0.0,
+        }
@@ -0,0 +1,993 @@
+'''XoWSClient, the connection to a single codec.'''
+
+
+import asyncio
+import collections
+import functools
+import inspect
+import logging
+import random
+import ssl as _ssl
+import time
+
+import aiohttp
+
+from . import (EXCEPTION_TYPES, XoWSError, ConnectionClosed, AuthenticationFailure,
+               NotEnabledError, HTTPNotEnabledError, ProxyError, RateLimitError,
+               RequestTimeout, jsonstream, tree)
+from .coalesce import Coalescer
+from .feedback import FeedbackStream
+from .jsonlib import get_backend
+from .mirror import StateMirror
+from .overflow import POLICIES, OverflowQueue
+from .scheduler import SendScheduler
+from .schema import SchemaCache
+
+
+_log = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def default_ssl_context():
+    '''The SSLContext shared by all clients not given one, without certificate
+    verification.'''
+    context = _ssl.SSLContext(_ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = _ssl.CERT_NONE
+    return context
+
+
+def _utf8_len(text):
+    'Returns the length of text encoded as UTF-8.'
+    return len(text) if text.isascii() else len(text.encode())
+
+
+def _retry_after(headers):
+    try:
+        return float(headers['Retry-After'])
+    except (TypeError, KeyError, ValueError):
+        return None
+
+
+class Batch:
+    '''Collects calls for XoWSClient, see XoWSClient.batch().
+
+    Calls return futures immediately, which resolve once the batch has been
+    sent on exit from the async with block and the codec has answered.'''
+
+    def __init__(self, client, timeout=None):
+        self._client = client
+        self._timeout = timeout
+        self._requests = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, *_):
+        requests, self._requests = self._requests, []
+        if exc_type is not None:
+            for req in requests:
+                # Calls that timed out meanwhile are no longer pending
+                future = self._client._resolve(req['id'], asyncio.CancelledError()) # pylint: disable=protected-access
+                if future is not None:
+                    future.cancel()
+        elif requests:
+            await self._client._send_scheduled(requests) # pylint: disable=protected-access
+
+    def api_call(self, method, **params):
+        'Adds a jsonrpc call to the batch. Returns a future for the result.'
+        req, future = self._client._new_request(method, params, self._timeout) # pylint: disable=protected-access
+        self._requests.append(req)
+        return future
+
+    def xGet(self, path):
+        'Gets a value or subtree.'
+        return self.api_call('xGet', Path=path)
+
+    def xQuery(self, query):
+        'Queries a tree.'
+        return self.api_call('xQuery', Query=query)
+
+    def xSet(self, path, value):
+        'Sets a value.'
+        return self.api_call('xSet', Path=path, Value=value)
+
+    def xCommand(self, command, **params):
+        'Runs a command.'
+        return self.api_call('xCommand/' + '/'.join(command), **params)
+
+
+class PreparedCall:
+    '''A call with its method and fixed params encoded once, see
+    XoWSClient.prepare(). Calling it with the remaining params, and
+    optionally timeout, performs the call and returns its result.
+
+    Prepared calls are always sent right away, also with coalesce, and xGet
+    isn't answered from the mirror.'''
+
+    # pylint: disable=protected-access
+
+    def __init__(self, client, method, fixed):
+        self._client = client
+        self.method = method
+        self.fixed = fixed
+        self._dumps = dumps = client._dumps
+        params = dumps(fixed)
+        head = '{"jsonrpc":"2.0","method":' + dumps(method) + ',"params":'
+        self._frame = head + params + ',"id":'
+        # Variable params are spliced in after the fixed ones
+        self._open = head + (params[:-1] + ',' if fixed else '{')
+        self._command = None
+        if method.startswith('xCommand/'):
+            self._command = method.split('/')[1:]
+
+    def _encode(self, id_, params):
+        if not params:
+            return f'{self._frame}{id_}}}'
+        if self.fixed and not self.fixed.keys().isdisjoint(params):
+            raise TypeError(f'Fixed params given again: {", ".join(self.fixed.keys() & params)}')
+        return f'{self._open}{self._dumps(params)[1:]},"id":{id_}}}'
+
+    def _validate(self, schema, params):
+        params = {**self.fixed, **params}
+        if self._command is not None:
+            schema.validate_command(self._command, params)
+        elif self.method == 'xSet':
+            schema.validate_set(params['Path'], params.get('Value'))
+
+    async def __call__(self, timeout=None, **params):
+        client = self._client
+        if client.schema is not None:
+            self._validate(client.schema, params)
+        id_, future = client._register(self.method, timeout)
+        try:
+            frame = self._encode(id_, params)
+        except Exception as err:
+            client._resolve(id_, err)
+            raise
+        if client._scheduler is not None and not await client._schedule(
+                [{'id': id_, 'method': self.method}]):
+            return await future
+        try:
+            await client.send(frame)
+        except Exception as err:
+            client._resolve(id_, err)
+            raise
+        return await future
+
+
+class XoWSClient:
+    '''XoWSClient accepts three parameters; hostname / url is the first
+    argument, and can be specified as e.g.
+
+    endpoint
+    endpoint.domain
+    ws://endpoint/ws
+    wss://endpoint/ws
+
+    SSL verification is disabled, unless an ssl.SSLContext is passed as
+    ssl. Clients share one SSLContext by default, see default_ssl_context().
+
+    An existing aiohttp.ClientSession can be passed as session, in which case
+    it is used for the connection and left open on disconnect. This is what
+    XoWSFleet does to share one connection pool between many clients.
+
+    If coalesce is set to True, all calls issued within the same event loop
+    iteration are sent together as a single jsonrpc batch frame. See also
+    batch() and api_call_batch() for explicit batching.
+
+    json_backend selects the JSON encoder / decoder, either by name ('orjson',
+    'msgspec' or 'json') or as a xows.jsonlib.JSONBackend. By default the
+    fastest installed backend is used.
+
+    timeout is the default number of seconds to wait for a response before
+    failing a call with RequestTimeout. None means wait forever. All calls
+    also accept a timeout overriding the default. Pending calls fail with
+    ConnectionClosed as soon as the connection is lost.
+
+    If reconnect is set to True, a lost connection is re-established with
+    jittered exponential backoff, starting below reconnect_delay seconds and
+    capped at reconnect_max_delay. Rate limiting (HTTP 503) is respected,
+    using Retry-After if the codec sends it. Subscriptions are replayed after
+    reconnecting, and handlers keep receiving the subscription Id returned by
+    subscribe(). reconnect_count and downtime (total seconds without a
+    connection) track recovery.
+
+    Feedback events are queued by the read loop and handlers are run by a
+    separate dispatcher task, so slow handlers don't delay responses. The
+    queue holds up to dispatch_maxsize events, dispatch_overflow decides what
+    happens when it is full: 'block' stops reading from the socket until
+    there is room, 'drop-oldest' and 'drop-newest' discard events. See
+    dispatch_stats.
+
+    Handlers may return an awaitable, which is run as a task. At most
+    max_handler_tasks such tasks run at once, further events wait in the
+    dispatch queue.
+
+    Events for a subscription Id that has no handler yet, because the
+    subscribe() response is still being processed, are buffered and
+    delivered once the handler is registered. Use EventRouter to share one
+    subscription between many handlers.
+
+    max_in_flight limits the number of calls awaiting a response, to avoid
+    flooding the codec until it answers NotReady. Further calls are queued
+    and sent in order of priority class, then arrival, see
+    xows.scheduler.SendScheduler. priority maps a method name to its class,
+    by default commands and xSet go before xGet / xQuery. None (default)
+    sends every call immediately. A call's timeout includes its time in the
+    queue.
+
+    schema enables local validation of xCommand and xSet calls against the
+    codec's schema, raising MethodNotFound or InvalidParameter without a
+    round trip. Pass True for the default xows.schema.SchemaCache, or a
+    SchemaCache. The schema is looked up on connect and after reconnecting,
+    fetched with xDoc once per software version; if that fails, calls are
+    sent unchecked. The current Schema is found in self.schema.
+
+    admission takes a xows.admission.ConnectAdmission shared with other
+    clients, to pace connects: connect() waits for admission, jitters and
+    retries rate limiting and proxy errors as configured there, reconnects
+    wait for admission.
+
+    metrics takes a xows.metrics.MetricsHooks, e.g. xows.metrics.Metrics,
+    which is then told about every frame, response and feedback event. With
+    max_in_flight, response times are measured from sending and the time
+    spent queued is reported separately.
+
+    Can be used as an async context manager.'''
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, url_or_host, username='admin', password='', session=None,
+                 coalesce=False, json_backend=None, timeout=None,
+                 reconnect=False, reconnect_delay=1.0, reconnect_max_delay=60.0,
+                 dispatch_maxsize=1000, dispatch_overflow='block',
+                 max_handler_tasks=100, max_in_flight=None, priority=None,
+                 schema=None, metrics=None, admission=None, ssl=None):
+        # pylint: disable=redefined-outer-name
+        self.host = url_or_host
+        if 's://' in url_or_host:
+            self._url = url_or_host
+        else:
+            self._url = f'wss://{url_or_host}/ws'
+        self._auth = aiohttp.helpers.BasicAuth(username, password)
+        self._ssl = ssl or default_ssl_context()
+        self._admission = admission
+        self._id_counter = 0
+        self._pending = {}
+        self._timers = {}
+        self._started = {}
+        self._raw_ids = set()
+        self.timeout = timeout
+        self._metrics = metrics
+        if metrics is not None:
+            metrics.add_client(self)
+        self._feedback_handlers = {}
+        self._subscriptions = {}
+        self._server_ids = {}
+        if dispatch_overflow not in POLICIES:
+            raise ValueError(f'dispatch_overflow must be one of {POLICIES}, '
+                             f'not {dispatch_overflow!r}')
+        # Created in connect(), so they belong to the loop actually running
+        self._dispatch_options = (dispatch_maxsize, dispatch_overflow)
+        self._dispatch = None
+        self._dispatched = 0
+        self._max_handler_tasks = max_handler_tasks
+        self._handler_slots = None
+        self._handler_tasks = set()
+        self._early_events = {}
+        self._mirror = None
+        self._coalesce = coalesce
+        self._outbox = []
+        if schema is True:
+            schema = SchemaCache()
+        self._schema_cache = schema or None
+        self.schema = None
+        self._scheduler = None
+        if max_in_flight is not None:
+            self._scheduler = SendScheduler(max_in_flight, priority)
+        self.json_backend = get_backend(json_backend)
+        self._dumps = self.json_backend.dumps
+        self._loads = self.json_backend.loads
+
+        self._reconnect = reconnect
+        self._reconnect_delay = reconnect_delay
+        self._reconnect_max_delay = reconnect_max_delay
+        self._reconnecting = self._stopping = False
+        self.reconnect_count = 0
+        self.downtime = 0.0
+
+        self._shared_session = session
+        self._session = self._client = self._closed = None
+        self._reader = self._dispatcher = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.disconnect()
+
+    async def connect(self):
+        '''Initializes the actual connection.
+
+        You most likely want to use the class as an async context manager
+        instead of calling connect() / disconnect().'''
+
+        self._closed = asyncio.get_running_loop().create_future()
+        self._stopping = False
+        if self._dispatch is None:
+            self._dispatch = OverflowQueue(*self._dispatch_options)
+            self._handler_slots = asyncio.Semaphore(self._max_handler_tasks)
+        if self._admission is not None:
+            await self._admission.connect(self._open)
+        else:
+            await self._open()
+        self._reader = asyncio.create_task(self._read_loop())
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+        if self._schema_cache is not None:
+            await self._load_schema()
+
+    async def _load_schema(self):
+        try:
+            self.schema = await self._schema_cache.get(self)
+        except (XoWSError, OSError) as err:
+            _log.warning('%s: no schema, not validating calls: %r', self._url, err)
+            self.schema = None
+
+    async def _open(self):
+        if self._session is None or self._session.closed:
+            self._session = self._shared_session or aiohttp.ClientSession()
+        error = None
+        try:
+            self._client = await self._session.ws_connect(self._url,
+                                                          auth=self._auth,
+                                                          ssl=self._ssl)
+        except aiohttp.client_exceptions.ClientError as err:
+            error = err
+            if not self._shared_session:
+                await self._session.close()
+
+        if error:
+            if not hasattr(error, 'status'):
+                raise ConnectionError(error)
+            if error.status == 401 and self._url.startswith('ws:'):
+                raise HTTPNotEnabledError(HTTPNotEnabledError.__doc__, error.status)
+            if error.status == 403:
+                raise AuthenticationFailure(AuthenticationFailure.__doc__, error.status)
+            if error.status == 502:
+                raise ProxyError(ProxyError.__doc__, error.status)
+            if error.status == 503:
+                exception = RateLimitError(RateLimitError.__doc__, error.status)
+                exception.retry_after = _retry_after(getattr(error, 'headers', None))
+                raise exception
+            raise NotEnabledError(NotEnabledError.__doc__, error.status)
+
+    def _backoff(self, attempt, error):
+        delay = min(self._reconnect_max_delay,
+                    self._reconnect_delay * 2 ** attempt)
+        if isinstance(error, RateLimitError):
+            if error.retry_after is not None:
+                return error.retry_after + random.uniform(0, self._reconnect_delay)
+            return random.uniform(delay / 2, delay)
+        return random.uniform(0, delay)
+
+    async def _reconnect_loop(self):
+        '''Reconnects until successful. Returns False if disconnect() was
+        called meanwhile, raises on errors that retrying won't fix.'''
+
+        self._reconnecting = True
+        down = time.monotonic()
+        attempt = 0
+        error = None
+        try:
+            while not self._stopping:
+                await asyncio.sleep(self._backoff(attempt, error))
+                try:
+                    if self._admission is not None:
+                        await self._admission.admit(self._open)
+                    else:
+                        await self._open()
+                except (AuthenticationFailure, HTTPNotEnabledError):
+                    raise
+                except (XoWSError, OSError, asyncio.TimeoutError) as err:
+                    _log.info('%s: reconnect attempt %d failed: %r',
+                              self._url, attempt + 1, err)
+                    attempt += 1
+                    error = err
+                    continue
+                self.reconnect_count += 1
+                _log.info('%s: reconnected after %.1f s', self._url,
+                          time.monotonic() - down)
+                asyncio.create_task(self._replay_subscriptions())
+                if self._schema_cache is not None:
+                    # May have been upgraded
+                    asyncio.create_task(self._load_schema())
+                return True
+            return False
+        finally:
+            self.downtime += time.monotonic() - down
+            self._reconnecting = False
+
+    async def _replay_subscriptions(self):
+        for local_id, (query, handler, notify) in list(self._subscriptions.items()):
+            try:
+                await self._subscribe(query, handler, notify, local_id)
+            except XoWSError as err:
+                _log.error('%s: failed to resubscribe %s: %r', self._url, query, err)
+
+    async def send(self, message):
+        "Sends data to server. message can be str, bytes, or json serializable."
+        if self._client.closed:
+            raise ConnectionClosed(ConnectionClosed.__doc__)
+        if isinstance(message, bytes):
+            await self._client.send_bytes(message)
+        else:
+            if not isinstance(message, str):
+                message = self._dumps(message)
+            await self._client.send_str(message)
+        if self._metrics is not None:
+            size = len(message) if isinstance(message, bytes) else _utf8_len(message)
+            self._metrics.frame_sent(self.host, size)
+
+    @staticmethod
+    def _make_exception(data):
+        error = data.get('error', None)
+        if error:
+            code = error.get('code', None)
+            exception = EXCEPTION_TYPES.get(code, XoWSError)
+            message = error.get('message', exception.__doc__)
+            if 'data' in error:
+                return exception(message, error['data'])
+            return exception(message)
+        return None
+
+    def _new_request(self, method, params, timeout=None):
+        id_, future = self._register(method, timeout)
+        req = {
+            'jsonrpc': '2.0',
+            'method': method,
+            'id': id_,
+            'params': params,
+        }
+        return req, future
+
+    def _register(self, method, timeout=None):
+        'Allocates an id and a pending future for a call of method.'
+        self._id_counter += 1
+        id_ = self._id_counter
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[id_] = future
+        if timeout is None:
+            timeout = self.timeout
+        if timeout is not None:
+            self._timers[id_] = loop.call_later(timeout, self._expire, id_)
+        if self._metrics is not None:
+            self._started[id_] = (method, time.perf_counter())
+        return id_, future
+
+    def _resolve(self, id_, exception=None):
+        '''Removes and returns the pending future for id_, or None.
+        exception is what the call failed with, for metrics.'''
+        timer = self._timers.pop(id_, None)
+        if timer is not None:
+            timer.cancel()
+        if self._scheduler is not None:
+            self._scheduler.release(id_)
+        if self._metrics is not None:
+            self._observe(id_, exception)
+        return self._pending.pop(id_, None)
+
+    def _observe(self, id_, exception):
+        started = self._started.pop(id_, None)
+        if started is not None:
+            method, start = started
+            self._metrics.response(self.host, method,
+                                   time.perf_counter() - start, exception)
+
+    def _expire(self, id_):
+        self._timers.pop(id_, None)
+        future = self._pending.pop(id_, None)
+        exception = RequestTimeout(RequestTimeout.__doc__, id_)
+        if self._scheduler is not None:
+            self._scheduler.release(id_)
+        if self._metrics is not None:
+            self._observe(id_, exception)
+        if future is not None and not future.done():
+            future.set_exception(exception)
+
+    def _fail_pending(self, exception):
+        pending, self._pending = self._pending, {}
+        timers, self._timers = self._timers, {}
+        for timer in timers.values():
+            timer.cancel()
+        if self._scheduler is not None:
+            for id_ in pending:
+                self._scheduler.release(id_)
+        if self._metrics is not None:
+            for id_ in pending:
+                self._observe(id_, exception)
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(exception)
+
+    @property
+    def pending_count(self):
+        'Number of calls awaiting a response.'
+        return len(self._pending)
+
+    @property
+    def queued_count(self):
+        'Number of calls waiting for the in-flight window, see max_in_flight.'
+        return 0 if self._scheduler is None else self._scheduler.queued
+
+    async def _schedule(self, requests):
+        '''Waits until requests fit in the in-flight window. Returns those
+        that are still pending, i.e. haven't timed out or failed meanwhile.'''
+        scheduler = self._scheduler
+        ids = [req['id'] for req in requests]
+        priority = min(scheduler.priority(req['method']) for req in requests)
+        calls = [self._pending[id_] for id_ in ids if id_ in self._pending]
+        if not calls:
+            return []
+        try:
+            if not await scheduler.acquire(ids, priority, calls):
+                # All timed out or failed while queued
+                return []
+        except asyncio.CancelledError:
+            for id_ in ids:
+                future = self._resolve(id_, asyncio.CancelledError())
+                if future is not None:
+                    future.cancel()
+            raise
+        live = []
+        for req in requests:
+            if req['id'] in self._pending:
+                live.append(req)
+            else:
+                scheduler.release(req['id'])
+        if self._metrics is not None:
+            now = time.perf_counter()
+            for req in live:
+                method, queued = self._started[req['id']]
+                self._metrics.queue_wait(self.host, method, now - queued)
+                self._started[req['id']] = (method, now)
+        return live
+
+    async def _send_scheduled(self, requests):
+        if self._scheduler is not None:
+            requests = await self._schedule(requests)
+        if requests:
+            await self._send_batch(requests)
+
+    async def _api_call(self, method, timeout=None, **params):
+        req, future = self._new_request(method, params, timeout)
+        if self._scheduler is not None and not await self._schedule([req]):
+            return future
+        if self._coalesce:
+            if not self._outbox:
+                asyncio.get_running_loop().call_soon(self._flush_outbox)
+            self._outbox.append(req)
+        else:
+            try:
+                await self.send(req)
+            except Exception as err:
+                self._resolve(req['id'], err)
+                raise
+        return future
+
+    def _flush_outbox(self):
+        requests, self._outbox = self._outbox, []
+        asyncio.create_task(self._send_batch(requests))
+
+    async def _send_batch(self, requests):
+        try:
+            await self.send(requests[0] if len(requests) == 1 else requests)
+        except Exception as err: # pylint: disable=broad-except
+            for req in requests:
+                future = self._resolve(req['id'], err)
+                if future and not future.done():
+                    future.set_exception(err)
+
+    async def api_call(self, method, timeout=None, **params):
+        '''Performs a jsonrpc call, autogenerating an ID.
+
+        Returns an awaitable for that specific request. timeout overrides
+        the client default, see XoWSClient.'''
+
+        future = await self._api_call(method, timeout, **params)
+        return await future
+
+    async def api_call_batch(self, calls, return_exceptions=False, timeout=None):
+        '''Performs several jsonrpc calls in one batch frame.
+
+        calls is an iterable of (method, params) tuples, where params is a
+        dict. Returns a list of results in the same order. If
+        return_exceptions is True, errors are returned in place of results,
+        otherwise the first error is raised.'''
+
+        futures = []
+        requests = []
+        for method, params in calls:
+            req, future = self._new_request(method, params, timeout)
+            requests.append(req)
+            futures.append(future)
+        if requests:
+            await self._send_scheduled(requests)
+        return await asyncio.gather(*futures, return_exceptions=return_exceptions)
+
+    def batch(self, timeout=None):
+        '''Returns a Batch, an async context manager collecting calls and
+        sending them in one frame on exit:
+
+            async with client.batch() as batch:
+                volume = batch.xGet(['Status', 'Audio', 'Volume'])
+                uptime = batch.xGet(['Status', 'SystemUnit', 'Uptime'])
+            print(await volume, await uptime)
+        '''
+        return Batch(self, timeout)
+
+    async def xGet(self, path, timeout=None):
+        '''Gets a value or subtree.
+
+        Paths covered by mirror() are answered from the local mirror.'''
+        mirror = self._mirror
+        if mirror is not None and mirror.covers(path):
+            if mirror.stale:
+                await mirror.refresh()
+            try:
+                return mirror.get(path)
+            except KeyError:
+                pass
+        return await self.api_call('xGet', timeout, Path=path)
+
+    async def xQuery(self, query, timeout=None):
+        'Queries a tree.'
+        return await self.api_call('xQuery', timeout, Query=query)
+
+    async def xSet(self, path, value, timeout=None):
+        'Sets a value. Returns True on success.'
+        if self.schema is not None:
+            self.schema.validate_set(path, value)
+        return await self.api_call('xSet', timeout, Path=path, Value=value)
+
+    async def xCommand(self, command, timeout=None, **params):
+        'Runs a command.'
+        if self.schema is not None:
+            self.schema.validate_command(command, params)
+        return await self.api_call('xCommand/' + '/'.join(command), timeout, **params)
+
+    async def leaves(self, method, patterns=None, timeout=None, **params):
+        '''Performs a call like api_call(), typically a large xQuery or xGet,
+        and yields the result as (path, value) leaves, see tree.iter_leaves().
+        xGet paths start with the requested Path.
+
+        The response is parsed as the leaves are consumed instead of being
+        decoded into one big tree. With patterns, a list of xQuery style
+        paths or a tree.PathTrie, only leaves they cover are yielded and other
+        subtrees are skipped without being decoded:
+
+            async for path, value in client.leaves(
+                    'xQuery', [['Status', 'Video', 'Input', 'Connector', '*', 'Connected']],
+                    Query=['Status', '**']):
+                print(path, value)
+        '''
+        if patterns is not None and not isinstance(patterns, tree.PathTrie):
+            patterns = tree.queries_trie(patterns)
+        req, future = self._new_request(method, params, timeout)
+        self._raw_ids.add(req['id'])
+        try:
+            if self._scheduler is not None and not await self._schedule([req]):
+                await future
+            try:
+                await self.send(req)
+            except Exception as err:
+                self._resolve(req['id'], err)
+                raise
+            text, start = await future
+        finally:
+            self._raw_ids.discard(req['id'])
+        prefix = tree.normalize_path(params['Path']) if method == 'xGet' else ()
+        for count, leaf in enumerate(jsonstream.leaves(text, start, prefix, patterns), 1):
+            yield leaf
+            if count % 1000 == 0:
+                # Don't starve the read loop on huge results
+                await asyncio.sleep(0)
+
+    def prepare(self, method, path=None, **fixed):
+        '''Returns a PreparedCall for repeating a call cheaply: the request
+        frame is encoded once, leaving only the id and the params passed per
+        call to be encoded each time. method is one of 'xCommand' (path is
+        the command), 'xGet', 'xQuery', 'xSet' (path is the path or query)
+        or any other method, taking no path. fixed are params that are the
+        same for every call:
+
+            set_volume = client.prepare('xCommand', ['Audio', 'Volume', 'Set'])
+            for level in range(30, 70):
+                await set_volume(Level=level)
+
+            volume = client.prepare('xGet', ['Status', 'Audio', 'Volume'])
+            print(await volume())
+
+            default_volume = client.prepare('xSet', ['Configuration', 'Audio', 'DefaultVolume'])
+            await default_volume(Value=50)
+        '''
+        if method == 'xCommand':
+            method = 'xCommand/' + '/'.join(path)
+        elif method in ('xGet', 'xSet'):
+            fixed['Path'] = path
+        elif method == 'xQuery':
+            fixed['Query'] = path
+        elif path is not None:
+            raise TypeError(f'{method} takes no path')
+        return PreparedCall(self, method, fixed)
+
+    async def subscribe(self, query, handler, notify_current_value=False,
+                        coalesce=None):
+        '''Subcribes to a query, running handler whenever value changes.
+
+        If notify_current_value is set to True, notifies the caller of current
+        value for all matching nodes.
+
+        If coalesce is set to a number of seconds, events are merged per leaf
+        path within that window and handler receives one CoalescedEvent, a
+        dict with the latest values plus counts of the events merged.
+
+        Returns the ID of the subscription.'''
+
+        if coalesce:
+            handler = Coalescer(handler, coalesce, self._track_in_slot)
+        return await self._subscribe(query, handler, notify_current_value)
+
+    async def _subscribe(self, query, handler, notify_current_value, local_id=None):
+        future = await self._api_call('xFeedback/Subscribe',
+                                      Query=query,
+                                      NotifyCurrentValue=notify_current_value)
+        def register_handler(fut):
+            if fut.cancelled() or fut.exception() is not None:
+                return
+            server_id = fut.result()['Id']
+            id_ = server_id if local_id is None else local_id
+            if local_id is not None and local_id in self._server_ids:
+                # Resubscribed after reconnecting, forget the old server Id
+                self._feedback_handlers.pop(self._server_ids[local_id], None)
+            self._feedback_handlers[server_id] = (handler, id_)
+            self._server_ids[id_] = server_id
+            self._subscriptions[id_] = (query, handler, notify_current_value)
+            if server_id in self._early_events:
+                self._deliver_early(server_id)
+        future.add_done_callback(register_handler)
+        data = await future
+        return data['Id'] if local_id is None else local_id
+
+    def feedback(self, query, maxsize=100, overflow='block',
+                 notify_current_value=False):
+        '''Returns a FeedbackStream for query, to be consumed with async for:
+
+            async for event in client.feedback(['Status', 'Audio', 'Volume']):
+                print(event)
+
+        Buffers at most maxsize events, see FeedbackStream for overflow.
+        Unsubscribes when the iteration is closed.'''
+        return FeedbackStream(self, query, maxsize, overflow, notify_current_value)
+
+    def _end_streams(self):
+        for handler, _ in self._feedback_handlers.values():
+            if isinstance(handler, FeedbackStream):
+                handler.end()
+
+    async def mirror(self, queries, max_age=None):
+        '''Starts mirroring the subtrees in queries locally, e.g.
+        [['Status', '**']]. xGet on mirrored paths is then answered without
+        a round trip to the codec. See StateMirror for max_age.
+
+        Returns the StateMirror.'''
+
+        if self._mirror is not None:
+            await self._mirror.stop()
+            self._mirror = None
+        mirror = StateMirror(self, queries, max_age)
+        await mirror.start()
+        self._mirror = mirror
+        return mirror
+
+    async def unsubscribe(self, id_):
+        'Unsubscribes a specified feedback subscription.'
+        server_id = self._server_ids.get(id_, id_)
+        ret = await self.api_call('xFeedback/Unsubscribe', Id=server_id)
+        self._server_ids.pop(id_, None)
+        self._subscriptions.pop(id_, None)
+        handler, _ = self._feedback_handlers.pop(server_id, (None, None))
+        if isinstance(handler, Coalescer):
+            handler.close()
+        return ret
+
+    def _process_raw(self, text):
+        '''Resolves the future of a leaves() call with the frame and the
+        position of its result, leaving it undecoded. Returns False if text
+        is some other frame.'''
+        spans = jsonstream.response_spans(text, self._raw_ids)
+        if spans is None:
+            return False
+        id_ = self._loads(text[slice(*spans['id'])])
+        exception = None
+        if 'error' in spans:
+            exception = self._make_exception({'error': self._loads(text[slice(*spans['error'])])})
+        future = self._resolve(id_, exception)
+        if future is None or future.done():
+            return True
+        if exception:
+            future.set_exception(exception)
+        else:
+            future.set_result((text, spans['result'][0]))
+        return True
+
+    def _process(self, data):
+        '''Resolves the future for a response. Returns the params of a
+        feedback event, None otherwise.'''
+        exception = self._make_exception(data)
+        if 'id' in data:
+            future = self._resolve(data['id'], exception)
+            if future is None or future.done():
+                # Timed out or cancelled
+                return None
+            if exception:
+                future.set_exception(exception)
+            else:
+                future.set_result(data['result'])
+            return None
+        if exception:
+            raise exception
+        assert data['method'] == 'xFeedback/Event'
+        return data['params']
+
+    async def _dispatch_loop(self):
+        queue = self._dispatch
+        while True:
+            params = await queue.get()
+            self._dispatched += 1
+            server_id = params.pop('Id')
+            try:
+                handler, id_ = self._feedback_handlers[server_id]
+            except KeyError:
+                self._buffer_early(server_id, params)
+                continue
+            if self._metrics is not None:
+                self._metrics.feedback_event(self.host, id_)
+            try:
+                ret = handler(params, id_)
+                if ret is None:
+                    continue
+                if isinstance(handler, FeedbackStream):
+                    await ret
+                elif inspect.isawaitable(ret):
+                    await self._handler_slots.acquire()
+                    self._track(ret, True)
+            except Exception: # pylint: disable=broad-except
+                _log.exception('%s: feedback handler failed', self._url)
+
+    EARLY_EVENTS_IDS = 16
+    EARLY_EVENTS_PER_ID = 1000
+
+    def _buffer_early(self, server_id, params):
+        early = self._early_events
+        if server_id not in early:
+            if len(early) >= self.EARLY_EVENTS_IDS:
+                del early[next(iter(early))]
+            early[server_id] = collections.deque(maxlen=self.EARLY_EVENTS_PER_ID)
+        early[server_id].append(params)
+
+    def _deliver_early(self, server_id):
+        handler, id_ = self._feedback_handlers[server_id]
+        for params in self._early_events.pop(server_id, ()):
+            try:
+                ret = handler(params, id_)
+                if inspect.isawaitable(ret):
+                    self._track(ret, False)
+            except Exception: # pylint: disable=broad-except
+                _log.exception('%s: feedback handler failed', self._url)
+
+    def _track(self, awaitable, slot):
+        task = asyncio.ensure_future(awaitable)
+        self._handler_tasks.add(task)
+        task.add_done_callback(functools.partial(self._handler_done, slot))
+
+    def _track_in_slot(self, awaitable):
+        # Called from a timer, so wait for a handler slot in the task itself
+        self._track(self._in_slot(awaitable), False)
+
+    async def _in_slot(self, awaitable):
+        async with self._handler_slots:
+            return await awaitable
+
+    def _handler_done(self, slot, task):
+        self._handler_tasks.discard(task)
+        if slot:
+            self._handler_slots.release()
+        if not task.cancelled() and task.exception() is not None:
+            _log.error('%s: feedback handler failed', self._url,
+                       exc_info=task.exception())
+
+    @property
+    def dispatch_stats(self):
+        '''Feedback dispatch counters: events queued right now, enqueued and
+        dispatched in total, and dropped due to the overflow policy.'''
+        queue = self._dispatch
+        if queue is None:
+            return {'queued': 0, 'enqueued': 0, 'dispatched': 0, 'dropped': 0}
+        return {
+            'queued': queue.qsize(),
+            'enqueued': queue.enqueued,
+            'dispatched': self._dispatched,
+            'dropped': queue.dropped,
+        }
+
+    async def _read_loop(self):
+        while True:
+            msg = await self._client.receive()
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                if self._metrics is not None:
+                    self._metrics.frame_received(self.host, _utf8_len(msg.data))
+                if self._raw_ids and self._process_raw(msg.data):
+                    continue
+                data = self._loads(msg.data)
+                for item in data if isinstance(data, list) else (data,):
+                    event = self._process(item)
+                    if event is not None:
+                        await self._dispatch.push(event)
+            elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                self._fail_pending(ConnectionClosed(ConnectionClosed.__doc__))
+                if self._mirror is not None:
+                    # Missing feedback from now on, don't answer from it
+                    self._mirror.invalidate()
+                error = None
+                if msg.type == aiohttp.WSMsgType.ERROR:
+                    error = ConnectionClosed(ConnectionClosed.__doc__)
+                if self._reconnect and not self._stopping:
+                    try:
+                        if await self._reconnect_loop():
+                            continue
+                    except XoWSError as err:
+                        error = err
+                # Closed for good: end feedback iteration and dispatch
+                self._end_streams()
+                self._dispatcher.cancel()
+                if not self._closed.done():
+                    if error is not None:
+                        self._closed.set_exception(error)
+                    else:
+                        self._closed.set_result(None)
+                break
+            elif msg.type in (aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.CLOSE):
+                pass
+            else:
+                raise RuntimeError(f'Unhandled msg type {msg.type}')
+
+    async def wait_until_closed(self):
+        '''Waits until the server closes the connection.
+
+        Useful in case of long-running feedback. With reconnect enabled, this
+        only returns after disconnect(), or if reconnecting fails for good.
+
+        Raises ConnectionClosed if there is a connection error, otherwise
+        returns None.'''
+        await self._closed
+
+    @property
+    def connected(self):
+        'True if the websocket is currently open.'
+        return self._client is not None and not self._client.closed
+
+    async def disconnect(self):
+        'Disconnect the session. See connect().'
+        self._stopping = True
+        await self._client.close()
+        if self._reconnecting:
+            self._reader.cancel()
+        self._dispatcher.cancel()
+        self._end_streams()
+        if not self._closed.done():
+            self._closed.set_result(None)
+        if not self._shared_session:
+            await self._session.close()
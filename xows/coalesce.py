@@ -0,0 +1,107 @@
+'Per-path coalescing of feedback events, see XoWSClient.subscribe().'
+
+
+import asyncio
+import inspect
+import logging
+
+from . import tree
+
+
+_log = logging.getLogger(__name__)
+
+
+class CoalescedEvent(dict):
+    '''Feedback event merged from several events received within a window.
+
+    Holds the latest value for every leaf path. events is the number of
+    events merged into this one, counts maps each leaf path (a tuple) to the
+    number of events that carried it.'''
+
+    def __init__(self, data, events, counts):
+        super().__init__(data)
+        self.events = events
+        self.counts = counts
+
+    @property
+    def collapsed(self):
+        'Number of events saved by coalescing.'
+        return self.events - 1
+
+
+class Coalescer:
+    '''Feedback handler wrapper merging events per leaf path.
+
+    The first event starts a window of window seconds, at the end of which
+    handler is called once with a CoalescedEvent holding the latest value of
+    every leaf seen.
+
+    An awaitable returned by handler is passed to track, which defaults to
+    running it as a task and logging its exception if any.'''
+
+    def __init__(self, handler, window, track=None):
+        self.handler = handler
+        self.window = window
+        self.track = track or self._spawn
+        self._tasks = set()
+        self._leaves = {}
+        self._counts = {}
+        self._ghosts = set()
+        self._events = 0
+        self._timer = None
+
+    def __call__(self, data, id_):
+        leaves = self._leaves
+        counts = self._counts
+        ghosts = self._ghosts
+        for path, value in tree.iter_leaves(data):
+            if path[-1] == 'ghost':
+                # Item removed, earlier updates to it no longer matter
+                item = path[:-1]
+                for old in [old for old in leaves if old[:len(item)] == item]:
+                    del leaves[old]
+                ghosts.add(item)
+            elif ghosts:
+                # Item added again after being removed
+                for item in [item for item in ghosts if path[:len(item)] == item]:
+                    ghosts.discard(item)
+                    del leaves[item + ('ghost',)]
+            leaves[path] = value
+            counts[path] = counts.get(path, 0) + 1
+        self._events += 1
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.window, self._flush, id_)
+
+    def _flush(self, id_):
+        event = CoalescedEvent(tree.build(self._leaves.items()),
+                               self._events, self._counts)
+        self._leaves = {}
+        self._counts = {}
+        self._ghosts = set()
+        self._events = 0
+        self._timer = None
+        ret = self.handler(event, id_)
+        if inspect.isawaitable(ret):
+            self.track(ret)
+
+    def _spawn(self, awaitable):
+        task = asyncio.ensure_future(awaitable)
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+
+    def _done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            _log.error('coalesced feedback handler failed',
+                       exc_info=task.exception())
+
+    def close(self):
+        'Discards events not yet delivered.'
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._leaves = {}
+        self._counts = {}
+        self._ghosts = set()
+        self._events = 0
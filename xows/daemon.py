@@ -0,0 +1,156 @@
+'''Long running process holding warm XoWSClient connections for short lived
+ones, see Daemon and xows.daemonclient.'''
+
+
+import asyncio
+import errno
+import json
+import logging
+import os
+import socket
+import time
+
+from .client import XoWSClient
+from .daemonclient import check_socket, default_socket, encode_error, private_dir
+
+
+_log = logging.getLogger(__name__)
+
+
+class Daemon:
+    '''Serves jsonrpc calls over a Unix socket at path (default
+    xows.daemonclient.default_socket()), each one JSON line naming host,
+    username, password, method and params, answered by a JSON line with
+    either result or error. Use xows.daemonclient.call() to make calls.
+
+    One XoWSClient per (host, username, password) is connected on first use
+    and kept open, so later calls skip TLS, authentication and session
+    setup. Clients idle for idle_timeout seconds are disconnected, as are
+    clients that lost their connection. client_options are passed on to
+    XoWSClient.
+
+    The socket is only accessible to the user running the daemon. Without
+    $XDG_RUNTIME_DIR it lives in a private 0700 directory under /tmp.'''
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, path=None, idle_timeout=300.0, **client_options):
+        self.path = path or default_socket()
+        self.idle_timeout = idle_timeout
+        self._client_options = client_options
+        self._clients = {}
+        self._last_used = {}
+        self._locks = {}
+        self._server = self._evictor = None
+        self.calls = 0
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.stop()
+
+    async def start(self):
+        '''Starts listening. Raises OSError if another daemon is listening
+        on path; a stale socket file is replaced. Raises PermissionError if
+        path, or the private directory it should be in, belongs to someone
+        else.'''
+        private_dir(self.path, create=True)
+        if os.path.lexists(self.path):
+            check_socket(self.path)
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            with probe:
+                try:
+                    probe.connect(self.path)
+                except OSError:
+                    os.unlink(self.path)
+                else:
+                    raise OSError(errno.EADDRINUSE, 'xows daemon already running',
+                                  self.path)
+        umask = os.umask(0o077)
+        try:
+            self._server = await asyncio.start_unix_server(self._handle, self.path)
+        finally:
+            os.umask(umask)
+        self._evictor = asyncio.create_task(self._evict_loop())
+
+    async def serve_forever(self):
+        'Serves until cancelled.'
+        await self._server.serve_forever()
+
+    async def stop(self):
+        'Stops listening and disconnects all clients.'
+        if self._evictor:
+            self._evictor.cancel()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        clients, self._clients = self._clients, {}
+        self._last_used.clear()
+        await asyncio.gather(*(client.disconnect() for client in clients.values()),
+                             return_exceptions=True)
+
+    async def connect(self, host, username='admin', password=''):
+        'Returns a connected client for host, connecting if needed.'
+        key = (host, username, password)
+        self._last_used[key] = time.monotonic()
+        client = self._clients.get(key)
+        if client is not None and client.connected:
+            return client
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            client = self._clients.get(key)
+            if client is None or not client.connected:
+                client = XoWSClient(host, username, password, **self._client_options)
+                await client.connect()
+                self._clients[key] = client
+                _log.info('%s: connected', host)
+        return client
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self._call(line)
+                writer.write(json.dumps(response, default=str).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _call(self, line):
+        self.calls += 1
+        try:
+            request = json.loads(line)
+            client = await self.connect(request['host'], request.get('username', 'admin'),
+                                        request.get('password', ''))
+            result = await client.api_call(request['method'], **request.get('params', {}))
+        except Exception as err: # pylint: disable=broad-except
+            return {'error': encode_error(err)}
+        return {'result': result}
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(min(self.idle_timeout, 10))
+            now = time.monotonic()
+            for key, client in list(self._clients.items()):
+                idle = now - self._last_used.get(key, now)
+                if (idle >= self.idle_timeout and client.pending_count == 0
+                        or not client.connected):
+                    del self._clients[key]
+                    self._last_used.pop(key, None)
+                    self._locks.pop(key, None)
+                    _log.info('%s: disconnecting, idle for %.0f s', key[0], idle)
+                    try:
+                        await client.disconnect()
+                    except Exception: # pylint: disable=broad-except
+                        pass
@@ -0,0 +1,120 @@
+'''Blocking client for the xows daemon, see xows.daemon.Daemon.
+
+Deliberately free of asyncio and aiohttp, so a short lived process can make
+a call through the daemon's warm connection with nothing but a Unix socket:
+
+    result = daemonclient.call('xGet', {'Path': ['Status', 'Audio', 'Volume']},
+                               'codec.example.com')
+'''
+
+
+import builtins
+import json
+import os
+import socket
+import stat
+import sys
+
+from . import XoWSError, ConnectionClosed
+
+
+SOCKET_ENV = 'XOWS_DAEMON_SOCKET'
+
+
+def _fallback_dir():
+    return f'/tmp/xows-{os.getuid()}'
+
+
+def default_socket():
+    '''Socket path from $XOWS_DAEMON_SOCKET, else xows.sock in
+    $XDG_RUNTIME_DIR, else xows.sock in the private directory
+    /tmp/xows-<uid>, see private_dir().'''
+    if os.environ.get(SOCKET_ENV):
+        return os.environ[SOCKET_ENV]
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return os.path.join(os.environ['XDG_RUNTIME_DIR'], 'xows.sock')
+    return os.path.join(_fallback_dir(), 'xows.sock')
+
+
+def private_dir(path, create=False):
+    '''Checks that the directory of socket path, if it is the /tmp fallback
+    directory, is a real directory owned by this user and closed to others,
+    creating it with mode 0700 if create is True. Raises PermissionError if
+    someone else got there first, FileNotFoundError if it doesn't exist.'''
+    directory = os.path.dirname(path)
+    if directory != _fallback_dir():
+        return
+    if create:
+        try:
+            os.mkdir(directory, 0o700)
+        except FileExistsError:
+            pass
+    info = os.lstat(directory)
+    if (not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid()
+            or info.st_mode & 0o077):
+        raise PermissionError(f'{directory} is not a private directory of this user')
+
+
+def check_socket(path):
+    '''Raises PermissionError unless path is a socket owned by this user,
+    FileNotFoundError if it doesn't exist. Done before trusting path with
+    credentials, so another local user can't listen there instead.'''
+    private_dir(path)
+    info = os.lstat(path)
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(f'{path} is not a socket owned by this user')
+
+
+_PLAIN = (str, int, float, bool, type(None), list, dict)
+
+
+def encode_error(err):
+    '''Error object for a response, see decode_error(). Arguments that
+    aren't plain JSON values become strings.'''
+    return {'type': type(err).__name__,
+            'args': [arg if isinstance(arg, _PLAIN) else str(arg) for arg in err.args]}
+
+
+def decode_error(error):
+    '''Rebuilds the exception encoded by encode_error(): an xows exception or
+    a builtin one of the same name, otherwise XoWSError.'''
+    package = vars(sys.modules[__package__])
+    for namespace in (package, vars(builtins)):
+        cls = namespace.get(error['type'])
+        if isinstance(cls, type) and issubclass(cls, Exception):
+            return cls(*error['args'])
+    return XoWSError(*error['args'])
+
+
+def call(method, params, host, username='admin', password='', path=None,
+         timeout=None):
+    '''Runs one jsonrpc call on host through the daemon listening on path
+    (default default_socket()) and returns the result.
+
+    Raises FileNotFoundError or ConnectionRefusedError if no daemon is
+    listening, so the caller can fall back to a direct connection, and
+    PermissionError if path isn't this user's socket, see check_socket().
+    Nothing is sent in that case. Once the request is sent, failures are
+    raised as XoWSError, or as the exception the call failed with in the
+    daemon.'''
+
+    path = path or default_socket()
+    check_socket(path)
+    request = {'host': host, 'username': username, 'password': password,
+               'method': method, 'params': params}
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        try:
+            sock.sendall(json.dumps(request).encode() + b'\n')
+            with sock.makefile('rb') as stream:
+                line = stream.readline()
+        except OSError as err:
+            raise ConnectionClosed(ConnectionClosed.__doc__, str(err)) from err
+    if not line:
+        raise ConnectionClosed(ConnectionClosed.__doc__)
+    response = json.loads(line)
+    if 'error' in response:
+        raise decode_error(response['error'])
+    return response['result']
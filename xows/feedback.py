@@ -0,0 +1,89 @@
+'Async iterator interface to feedback, see XoWSClient.feedback().'
+
+
+from . import XoWSError
+from .overflow import OverflowQueue
+
+
+_END = object()
+
+
+class FeedbackStream:
+    '''Subscription delivering feedback events through async iteration:
+
+        async for event in client.feedback(['Status', 'Audio', 'Volume']):
+            print(event)
+
+    Subscribes when iteration starts and unsubscribes when the iteration is
+    closed, e.g. by leaving the loop, or on leaving async with. Iteration
+    ends when the connection is closed.
+
+    At most maxsize events are buffered, overflow decides what happens when
+    the buffer is full, see OverflowQueue. With 'block', feedback dispatch
+    for the whole connection waits for the consumer. dropped counts
+    discarded events.'''
+
+    def __init__(self, client, query, maxsize=100, overflow='block',
+                 notify_current_value=False):
+        self._client = client
+        self._query = query
+        self._notify_current_value = notify_current_value
+        self._queue = OverflowQueue(maxsize, overflow)
+        self._block = overflow == 'block'
+        self._ended = False
+        self.id = None
+
+    def __call__(self, data, _):
+        if self._block:
+            # The dispatcher awaits this, see XoWSClient._dispatch_loop
+            return self._queue.push(data)
+        self._queue.offer(data)
+        return None
+
+    @property
+    def dropped(self):
+        'Number of events discarded due to the overflow policy.'
+        return self._queue.dropped
+
+    async def start(self):
+        'Subscribes. Called automatically when iteration starts.'
+        if self.id is None:
+            self.id = await self._client.subscribe(
+                self._query, self, self._notify_current_value)
+
+    async def aclose(self):
+        'Unsubscribes and ends iteration.'
+        id_, self.id = self.id, None
+        if id_ is not None and self._client.connected:
+            try:
+                await self._client.unsubscribe(id_)
+            except XoWSError:
+                pass
+        self.end()
+
+    def end(self):
+        'Ends iteration once buffered events have been consumed.'
+        self._ended = True
+        if self._queue.empty():
+            self._queue.put_nowait(_END)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.aclose()
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await self.start()
+        try:
+            while not (self._ended and self._queue.empty()):
+                event = await self._queue.get()
+                if event is _END:
+                    break
+                yield event
+        finally:
+            await self.aclose()
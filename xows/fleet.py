@@ -0,0 +1,194 @@
+'Manage many XoWSClient connections over one shared connection pool.'
+
+
+import asyncio
+import collections
+
+import aiohttp
+
+from .admission import ConnectAdmission
+from .client import XoWSClient, default_ssl_context
+
+
+HostResult = collections.namedtuple('HostResult', 'host result error')
+HostResult.__doc__ = '''Result of a fleet call for a single host.
+
+error is None on success, otherwise it holds the exception raised for that
+host and result is None.'''
+
+
+class XoWSFleet:
+    '''XoWSFleet manages XoWSClient connections to a set of hosts, all sharing
+    one aiohttp.ClientSession and connector.
+
+    hosts is an iterable of hostnames or urls, as accepted by XoWSClient.
+
+    max_connects caps how many connection attempts run at once, max_calls caps
+    how many api calls are in flight at once across the whole fleet.
+    timeout is the default call timeout for every client, reconnect enables
+    automatic reconnects for every client and metrics and ssl are shared by
+    all clients, see XoWSClient.
+
+    Connects go through admission, a xows.admission.ConnectAdmission, by
+    default one allowing max_connects at once. Pass your own to also limit
+    the connect rate, jitter the start or change retries of rate limited
+    connects. connect_stats() reports how long connecting took.
+
+    Calls are fanned out to every connected host (or the hosts given) and
+    results are yielded as HostResult as soon as each host answers:
+
+        async with XoWSFleet(hosts, password='secret') as fleet:
+            async for res in fleet.xGet(['Status', 'SystemUnit', 'Uptime']):
+                print(res.host, res.error or res.result)
+
+    Hosts that failed to connect are found in fleet.failed.
+
+    Can be used as an async context manager.'''
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, hosts, username='admin', password='',
+                 max_connects=50, max_calls=500, limit=0, timeout=None,
+                 reconnect=False, metrics=None, admission=None, ssl=None):
+        # pylint: disable=redefined-outer-name
+        self.hosts = list(dict.fromkeys(hosts))
+        self._username = username
+        self._password = password
+        self._max_calls = max_calls
+        self._limit = limit
+        self._timeout = timeout
+        self._reconnect = reconnect
+        self._metrics = metrics
+        self._admission = admission or ConnectAdmission(max_connects)
+        self._ssl = ssl or default_ssl_context()
+
+        self.clients = {}
+        self.failed = {}
+        self._session = self._call_sem = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.disconnect()
+
+    async def connect(self):
+        '''Connects to all hosts, at most max_connects at a time.
+
+        Connection errors don't propagate, they are stored in self.failed.'''
+
+        self._start()
+        await asyncio.gather(*(self._connect_one(host) for host in self.hosts
+                               if host not in self.clients))
+
+    def _start(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self._limit, ssl=self._ssl)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._call_sem = asyncio.Semaphore(self._max_calls)
+
+    async def _connect_one(self, host):
+        client = XoWSClient(host, self._username, self._password,
+                            session=self._session, timeout=self._timeout,
+                            reconnect=self._reconnect,
+                            metrics=self._metrics, admission=self._admission,
+                            ssl=self._ssl)
+        try:
+            await client.connect()
+        except Exception as err: # pylint: disable=broad-except
+            self.failed[host] = err
+            return
+        self.failed.pop(host, None)
+        self.clients[host] = client
+
+    async def _call(self, host, method, params):
+        async with self._call_sem:
+            try:
+                result = await self.clients[host].api_call(method, **params)
+            except Exception as err: # pylint: disable=broad-except
+                return HostResult(host, None, err)
+        return HostResult(host, result, None)
+
+    async def api_call(self, method, hosts=None, **params):
+        '''Performs a jsonrpc call on every connected host (or the subset given
+        in hosts), yielding HostResult in completion order.'''
+
+        if hosts is None:
+            hosts = list(self.clients)
+        for task in asyncio.as_completed([self._call(host, method, params)
+                                          for host in hosts
+                                          if host in self.clients]):
+            yield await task
+
+    async def map(self, fun, hosts=None):
+        '''Runs await fun(client) for every host (default self.hosts),
+        connecting hosts that aren't connected yet, and yields HostResult in
+        completion order. Unlike connect() followed by api_call(), each host
+        is called as soon as it is connected, so no host waits for the
+        slowest connect. Connection errors are yielded as the error of that
+        host, and also stored in self.failed.'''
+
+        self._start()
+
+        async def run(host):
+            if host not in self.clients:
+                await self._connect_one(host)
+                if host not in self.clients:
+                    return HostResult(host, None, self.failed[host])
+            async with self._call_sem:
+                try:
+                    result = await fun(self.clients[host])
+                except Exception as err: # pylint: disable=broad-except
+                    return HostResult(host, None, err)
+            return HostResult(host, result, None)
+
+        if hosts is None:
+            hosts = self.hosts
+        for task in asyncio.as_completed([run(host) for host in hosts]):
+            yield await task
+
+    def xGet(self, path, hosts=None):
+        'Gets a value or subtree from all hosts.'
+        return self.api_call('xGet', hosts, Path=path)
+
+    def xQuery(self, query, hosts=None):
+        'Queries a tree on all hosts.'
+        return self.api_call('xQuery', hosts, Query=query)
+
+    def xSet(self, path, value, hosts=None):
+        'Sets a value on all hosts.'
+        return self.api_call('xSet', hosts, Path=path, Value=value)
+
+    def xCommand(self, command, hosts=None, **params):
+        'Runs a command on all hosts.'
+        return self.api_call('xCommand/' + '/'.join(command), hosts, **params)
+
+    def connect_stats(self):
+        '''Returns the admission stats, see ConnectAdmission.stats(): hosts
+        connected and failed, attempts, retries and seconds from the first
+        connect starting to the last one finishing, i.e. the time to get the
+        fleet connected.'''
+        return self._admission.stats()
+
+    def reconnect_stats(self):
+        '''Returns a dict with the number of clients currently connected, the
+        number of clients, total reconnects and total downtime in seconds
+        across the fleet.'''
+        clients = self.clients.values()
+        return {
+            'connected': sum(client.connected for client in clients),
+            'clients': len(clients),
+            'reconnects': sum(client.reconnect_count for client in clients),
+            'downtime': sum(client.downtime for client in clients),
+        }
+
+    async def disconnect(self):
+        'Disconnects all clients and closes the shared session.'
+        await asyncio.gather(*(client.disconnect()
+                               for client in self.clients.values()),
+                             return_exceptions=True)
+        self.clients.clear()
+        if self._session:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,68 @@
+'''JSON encoder / decoder backends used by XoWSClient.
+
+orjson or msgspec are used when installed, otherwise the standard library json
+module. A specific backend can be picked by name, see get_backend().'''
+
+
+import collections
+import json
+
+
+JSONBackend = collections.namedtuple('JSONBackend', 'name dumps loads')
+JSONBackend.__doc__ = '''A JSON backend. dumps must return str, loads must
+accept str.'''
+
+
+def _orjson():
+    import orjson # pylint: disable=import-outside-toplevel
+    def dumps(obj, _dumps=orjson.dumps):
+        return _dumps(obj).decode()
+    return JSONBackend('orjson', dumps, orjson.loads)
+
+def _msgspec():
+    import msgspec # pylint: disable=import-outside-toplevel
+    encode = msgspec.json.Encoder().encode
+    def dumps(obj):
+        return encode(obj).decode()
+    return JSONBackend('msgspec', dumps, msgspec.json.Decoder().decode)
+
+def _stdlib():
+    return JSONBackend('json', json.JSONEncoder(separators=(',', ':')).encode,
+                       json.JSONDecoder().decode)
+
+
+BACKENDS = {
+    'orjson': _orjson,
+    'msgspec': _msgspec,
+    'json': _stdlib,
+}
+
+
+def available_backends():
+    'Returns the names of all backends that can be loaded, fastest first.'
+    names = []
+    for name, factory in BACKENDS.items():
+        try:
+            factory()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_backend(backend=None):
+    '''Returns a JSONBackend.
+
+    backend can be a JSONBackend, the name of one of BACKENDS, or None to pick
+    the fastest one installed.'''
+
+    if isinstance(backend, JSONBackend):
+        return backend
+    if backend is not None:
+        return BACKENDS[backend]()
+    for factory in (_orjson, _msgspec):
+        try:
+            return factory()
+        except ImportError:
+            pass
+    return _stdlib()
@@ -0,0 +1,167 @@
+'''Incremental parsing of large JSON responses into leaves.
+
+leaves() walks a JSON document in a str and yields (path, value) for its
+leaves like tree.iter_leaves() would for the decoded document, without
+building the document. Subtrees that a PathTrie filter can't match are
+skipped without being decoded at all.'''
+
+
+import json
+import re
+
+
+_WS = re.compile(r'[ \t\n\r]*')
+# Everything up to the next bracket outside of a string
+_NO_BRACKETS = re.compile(r'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+_scanstring = json.decoder.scanstring
+_raw_decode = json.JSONDecoder().raw_decode
+
+
+def _ws(text, pos):
+    return _WS.match(text, pos).end()
+
+
+def _scalar(text, pos):
+    if text[pos] == '"':
+        return _scanstring(text, pos + 1)
+    return _raw_decode(text, pos)
+
+
+def skip(text, pos):
+    'Returns the position after the JSON value starting at or after pos.'
+    pos = _ws(text, pos)
+    if text[pos] not in '{[':
+        return _scalar(text, pos)[1]
+    depth = 0
+    while True:
+        pos = _NO_BRACKETS.match(text, pos).end()
+        if pos >= len(text):
+            raise ValueError('Unterminated JSON value')
+        depth += 1 if text[pos] in '{[' else -1
+        pos += 1
+        if depth == 0:
+            return pos
+
+
+def _members(text, pos):
+    '''Yields (key, value position) for the object whose '{' is before pos.
+    The caller must move pos to the end of each value by sending it.'''
+    pos = _ws(text, pos)
+    if text[pos] == '}':
+        return
+    while True:
+        key, pos = _scanstring(text, _ws(text, pos) + 1)
+        pos = yield key, _ws(text, _ws(text, pos) + 1)
+        pos = _ws(text, pos)
+        if text[pos] == '}':
+            return
+        pos += 1
+
+
+def response_spans(text, ids):
+    '''Scans the top level of a jsonrpc response. Returns a dict mapping its
+    keys to (start, end) of their values, or None if text isn't an object or
+    its id isn't in ids. Values are skipped, not decoded.'''
+    pos = _ws(text, 0)
+    if not text.startswith('{', pos):
+        return None
+    spans = {}
+    members = _members(text, pos + 1)
+    end = None
+    try:
+        while True:
+            key, start = members.send(end)
+            end = skip(text, start)
+            spans[key] = (start, end)
+            if key == 'id' and json.loads(text[start:end]) not in ids:
+                return None
+    except StopIteration:
+        pass
+    return spans if 'id' in spans else None
+
+
+def leaves(text, pos=0, prefix=(), trie=None):
+    '''Yields (path, value) for the leaves of the JSON value at pos in text,
+    with paths starting with prefix. With trie, only leaves matching one of
+    its patterns are yielded and other subtrees are skipped.
+
+    As in tree.iter_leaves(), list items with an 'id' contribute the id to
+    the path, other list items their position.'''
+    yield from _leaves(text, pos, prefix, trie)
+
+
+def _leaves(text, pos, path, trie):
+    pos = _ws(text, pos)
+    char = text[pos]
+    if char == '{':
+        return (yield from _object(text, pos + 1, path, trie))
+    if char == '[':
+        return (yield from _array(text, pos + 1, path, trie))
+    value, end = _scalar(text, pos)
+    if trie is None or trie.match(path):
+        yield path, value
+    return end
+
+
+def _member(text, pos, path, trie):
+    if trie is not None and not trie.could_match(path):
+        return skip(text, pos)
+    return (yield from _leaves(text, pos, path, trie))
+
+
+def _object(text, pos, path, trie):
+    members = _members(text, pos)
+    end = None
+    try:
+        while True:
+            key, start = members.send(end)
+            end = yield from _member(text, start, path + (key,), trie)
+    except StopIteration:
+        pass
+    return _ws(text, end if end is not None else pos) + 1
+
+
+def _array(text, pos, path, trie):
+    pos = _ws(text, pos)
+    if text[pos] == ']':
+        return pos + 1
+    index = 0
+    while True:
+        pos = _ws(text, pos)
+        if text[pos] == '{':
+            pos = yield from _item(text, pos + 1, path, index, trie)
+        else:
+            pos = yield from _member(text, pos, path + (index,), trie)
+        index += 1
+        pos = _ws(text, pos)
+        if text[pos] == ']':
+            return pos + 1
+        pos += 1
+
+
+def _item(text, pos, path, index, trie):
+    # The item's path depends on its 'id', which may come after other keys:
+    # remember where those are and walk them once the id is known.
+    pending = []
+    prefix = None
+    members = _members(text, pos)
+    end = None
+    try:
+        while True:
+            key, start = members.send(end)
+            if prefix is None and key == 'id':
+                id_, end = _scalar(text, start)
+                prefix = path + (id_,)
+                for key_, start_ in pending:
+                    yield from _member(text, start_, prefix + (key_,), trie)
+            elif prefix is None:
+                pending.append((key, start))
+                end = skip(text, start)
+            else:
+                end = yield from _member(text, start, prefix + (key,), trie)
+    except StopIteration:
+        pass
+    if prefix is None:
+        for key, start in pending:
+            yield from _member(text, start, path + (index, key), trie)
+    return _ws(text, end if end is not None else pos) + 1
@@ -0,0 +1,205 @@
+'''Client instrumentation: a hook API and a Prometheus text format exporter.
+
+Pass a MetricsHooks instance as metrics to XoWSClient or XoWSFleet. The
+same instance can be shared by any number of clients, every hook gets the
+client's host as first argument. Without metrics, the client does no
+bookkeeping at all.'''
+
+
+import bisect
+import collections
+import weakref
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+class MetricsHooks:
+    '''No-op base class for client hooks. Subclass and override what you
+    need, e.g. to feed another metrics system.'''
+
+    def add_client(self, client):
+        'Called once for every client using these hooks.'
+
+    def frame_sent(self, host, size):
+        'A websocket frame of size bytes (UTF-8) was sent.'
+
+    def frame_received(self, host, size):
+        'A websocket frame of size bytes (UTF-8) was received.'
+
+    def response(self, host, method, seconds, exception):
+        '''A call to method finished after seconds. exception is None on
+        success, otherwise the exception the call failed with.'''
+
+    def queue_wait(self, host, method, seconds):
+        '''A call to method waited seconds for the in-flight window before
+        being sent. Only called for clients with max_in_flight.'''
+
+    def feedback_event(self, host, subscription_id):
+        'A feedback event for subscription_id was dispatched.'
+
+
+class Histogram:
+    'Cumulative histogram in the Prometheus sense.'
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        'Adds a sample.'
+        pos = bisect.bisect_left(self.buckets, value)
+        if pos < len(self.counts):
+            self.counts[pos] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        'Yields (upper bound, cumulative count), ending with +Inf.'
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+        yield float('inf'), self.count
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"'
+                          for key, value in labels.items()) + '}'
+
+
+def _bound(value):
+    return '+Inf' if value == float('inf') else repr(value)
+
+
+class Metrics(MetricsHooks):
+    '''Collects per host metrics from any number of clients:
+
+    - round trip histograms per method (xGet, xCommand/Audio/Volume/Set, ...)
+    - histograms of time spent waiting for the in-flight window, per method
+    - frames and bytes sent and received
+    - feedback events per subscription Id
+    - errors per exception class
+    - pending and queued requests, dropped feedback and reconnects, read from the clients
+      at export time
+
+    prometheus() renders everything in the Prometheus text format, serve()
+    exposes it over HTTP.'''
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._buckets = buckets
+        self._clients = weakref.WeakSet()
+        self.latency = collections.defaultdict(lambda: Histogram(self._buckets))
+        self.queue_latency = collections.defaultdict(lambda: Histogram(self._buckets))
+        self.frames_sent = collections.Counter()
+        self.bytes_sent = collections.Counter()
+        self.frames_received = collections.Counter()
+        self.bytes_received = collections.Counter()
+        self.feedback = collections.Counter()
+        self.errors = collections.Counter()
+
+    def add_client(self, client):
+        self._clients.add(client)
+
+    def frame_sent(self, host, size):
+        self.frames_sent[host] += 1
+        self.bytes_sent[host] += size
+
+    def frame_received(self, host, size):
+        self.frames_received[host] += 1
+        self.bytes_received[host] += size
+
+    def response(self, host, method, seconds, exception):
+        self.latency[host, method].observe(seconds)
+        if exception is not None:
+            self.errors[host, type(exception).__name__] += 1
+
+    def queue_wait(self, host, method, seconds):
+        self.queue_latency[host, method].observe(seconds)
+
+    def feedback_event(self, host, subscription_id):
+        self.feedback[host, subscription_id] += 1
+
+    def prometheus(self):
+        'Returns all metrics in the Prometheus text exposition format.'
+        lines = []
+        def metric(name, kind, doc):
+            lines.append(f'# HELP {name} {doc}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        for name, histograms, doc in (
+                ('xows_request_duration_seconds', self.latency,
+                 'Round trip time of calls per method.'),
+                ('xows_queue_wait_seconds', self.queue_latency,
+                 'Time calls waited for the in-flight window per method.')):
+            metric(name, 'histogram', doc)
+            for (host, method), hist in sorted(histograms.items()):
+                for bound, count in hist.cumulative():
+                    labels = _labels(host=host, method=method, le=_bound(bound))
+                    lines.append(f'{name}_bucket{labels} {count}')
+                labels = _labels(host=host, method=method)
+                lines.append(f'{name}_sum{labels} {hist.sum}')
+                lines.append(f'{name}_count{labels} {hist.count}')
+
+        for name, counter, doc in (
+                ('xows_frames_sent_total', self.frames_sent, 'Websocket frames sent.'),
+                ('xows_bytes_sent_total', self.bytes_sent, 'Bytes sent.'),
+                ('xows_frames_received_total', self.frames_received,
+                 'Websocket frames received.'),
+                ('xows_bytes_received_total', self.bytes_received,
+                 'Bytes received.')):
+            metric(name, 'counter', doc)
+            for host, value in sorted(counter.items()):
+                lines.append(f'{name}{_labels(host=host)} {value}')
+
+        metric('xows_feedback_events_total', 'counter',
+               'Feedback events dispatched per subscription.')
+        for (host, id_), value in sorted(self.feedback.items(), key=str):
+            lines.append(f'xows_feedback_events_total{_labels(host=host, subscription=id_)} {value}')
+
+        metric('xows_errors_total', 'counter', 'Failed calls per exception class.')
+        for (host, name), value in sorted(self.errors.items()):
+            lines.append(f'xows_errors_total{_labels(host=host, exception=name)} {value}')
+
+        clients = sorted(self._clients, key=lambda client: client.host)
+        for name, kind, doc, value in (
+                ('xows_pending_requests', 'gauge', 'Calls awaiting a response.',
+                 lambda client: client.pending_count),
+                ('xows_queued_requests', 'gauge',
+                 'Calls waiting for the in-flight window.',
+                 lambda client: client.queued_count),
+                ('xows_connected', 'gauge', '1 if the websocket is open.',
+                 lambda client: int(client.connected)),
+                ('xows_feedback_dropped_total', 'counter',
+                 'Feedback events dropped by the dispatch queue.',
+                 lambda client: client.dispatch_stats['dropped']),
+                ('xows_reconnects_total', 'counter', 'Successful reconnects.',
+                 lambda client: client.reconnect_count)):
+            metric(name, kind, doc)
+            for client in clients:
+                lines.append(f'{name}{_labels(host=client.host)} {value(client)}')
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, host='0.0.0.0', port=9100):
+        '''Serves prometheus() on http://host:port/metrics. Returns the
+        aiohttp AppRunner, call its cleanup() to stop.'''
+        from aiohttp import web # pylint: disable=import-outside-toplevel
+
+        async def handle(_):
+            return web.Response(body=self.prometheus().encode(), headers={
+                'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+        app = web.Application()
+        app.router.add_get('/metrics', handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
@@ -0,0 +1,99 @@
+'Local copy of parts of the codec document tree, kept up to date by feedback.'
+
+
+import copy
+import time
+
+from . import tree
+
+
+class StateMirror:
+    '''StateMirror keeps an in-memory copy of one or more subtrees, e.g.
+    ['Status', '**'] or ['Configuration', 'Audio', '**'].
+
+    Each query is a literal path, optionally ending in '**'. The mirror
+    subscribes to every query with NotifyCurrentValue, seeds itself with
+    xQuery and then merges every feedback event into the local tree.
+
+    If max_age is given, the mirror is considered stale that many seconds
+    after the last full sync, and is re-seeded by the next lookup.
+
+    Usually created through XoWSClient.mirror(), which makes xGet answer
+    mirrored paths locally.'''
+
+    def __init__(self, client, queries, max_age=None):
+        self._client = client
+        self._queries = [tree.normalize_path(query) for query in queries]
+        for query in self._queries:
+            if any(part in ('*', '**') for part in query[:-1]):
+                raise ValueError(f'Only trailing "**" is supported: {query}')
+        self._roots = [query[:-1] if query[-1:] == ('**',) else query
+                       for query in self._queries]
+        self.max_age = max_age
+        self.tree = {}
+        self.synced = None
+        self._subscriptions = []
+        self._refreshing = []
+
+    def _handler(self, data, _):
+        tree.merge(self.tree, data)
+        for events in self._refreshing:
+            events.append(copy.deepcopy(data))
+
+    async def start(self):
+        'Subscribes to feedback and seeds the mirror.'
+        for query in self._queries:
+            self._subscriptions.append(
+                await self._client.subscribe(list(query), self._handler, True))
+        await self.refresh()
+
+    async def refresh(self):
+        '''Re-seeds the mirror with xQuery.
+
+        Replaces the local tree, so values that drifted are corrected.
+        Feedback received while the query was in flight is merged over the
+        query result, as it is at least as recent.'''
+
+        events = []
+        self._refreshing.append(events)
+        try:
+            seed = {}
+            for query in self._queries:
+                tree.merge(seed, await self._client.xQuery(list(query)))
+        finally:
+            self._refreshing.remove(events)
+        for data in events:
+            tree.merge(seed, data)
+        self.tree = seed
+        self.synced = time.monotonic()
+
+    async def stop(self):
+        'Unsubscribes from feedback. The mirror is stale afterwards.'
+        subscriptions, self._subscriptions = self._subscriptions, []
+        for id_ in subscriptions:
+            await self._client.unsubscribe(id_)
+        self.synced = None
+
+    def invalidate(self):
+        '''Drops the local tree, e.g. after reconnecting. The mirror is
+        re-seeded by the next lookup.'''
+        self.tree = {}
+        self.synced = None
+
+    @property
+    def stale(self):
+        'True if the mirror needs to be re-seeded before use.'
+        if self.synced is None:
+            return True
+        return (self.max_age is not None
+                and time.monotonic() - self.synced > self.max_age)
+
+    def covers(self, path):
+        'True if path lies inside one of the mirrored subtrees.'
+        path = tree.normalize_path(path)
+        return any(path[:len(root)] == root for root in self._roots)
+
+    def get(self, path):
+        '''Returns a copy of the value at path. Raises KeyError if the path
+        isn't present in the mirror.'''
+        return copy.deepcopy(tree.get(self.tree, path))
@@ -0,0 +1,53 @@
+'Bounded asyncio queue with a configurable overflow policy.'
+
+
+import asyncio
+
+
+POLICIES = ('block', 'drop-oldest', 'drop-newest')
+
+
+class OverflowQueue(asyncio.Queue):
+    '''asyncio.Queue deciding what happens when it is full.
+
+    overflow is one of POLICIES:
+
+    block: push() waits for room, applying backpressure to the producer.
+    drop-oldest: the oldest queued item is discarded to make room.
+    drop-newest: the item being pushed is discarded.
+
+    enqueued and dropped count items accepted and discarded.'''
+
+    def __init__(self, maxsize=0, overflow='block'):
+        if overflow not in POLICIES:
+            raise ValueError(f'overflow must be one of {POLICIES}, not {overflow!r}')
+        super().__init__(maxsize)
+        self.overflow = overflow
+        self.enqueued = 0
+        self.dropped = 0
+
+    def offer(self, item):
+        '''Adds item without waiting. Returns False if an item was dropped.
+
+        Raises asyncio.QueueFull if full and the policy is block.'''
+
+        dropped = False
+        if self.full():
+            if self.overflow == 'drop-newest':
+                self.dropped += 1
+                return False
+            if self.overflow == 'drop-oldest':
+                self.get_nowait()
+                self.dropped += 1
+                dropped = True
+        self.put_nowait(item)
+        self.enqueued += 1
+        return not dropped
+
+    async def push(self, item):
+        'Adds item, waiting for room if the policy is block.'
+        if self.overflow == 'block' and self.full():
+            await self.put(item)
+            self.enqueued += 1
+        else:
+            self.offer(item)
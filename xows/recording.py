@@ -0,0 +1,285 @@
+'''Recording feedback events to disk and replaying them.
+
+A recording is a directory of gzip compressed segments, each holding one
+JSON array [time, host, id, event] per line, plus index.jsonl listing every
+closed segment with the time range and number of events it covers:
+
+    recorder = Recorder('incident')
+    for client in fleet.clients.values():
+        await recorder.attach(client, ['Status', '**'])
+    ...
+    recorder.close()
+
+    replay = Replay(Recording('incident'), speed=10)
+    await replay.subscribe(['Status', 'Call'], handler)
+    await replay.run()
+'''
+
+
+import asyncio
+import collections
+import gzip
+import inspect
+import json
+import os
+import time
+
+from . import tree
+from .coalesce import Coalescer
+
+
+INDEX = 'index.jsonl'
+SUFFIX = '.jsonl.gz'
+
+
+RecordedEvent = collections.namedtuple('RecordedEvent', 'time host id data')
+RecordedEvent.__doc__ = '''A recorded feedback event. time is the wall clock
+time it was received, id the subscription Id the handler got.'''
+
+
+class Recorder:
+    '''Appends feedback events to the recording in directory, creating it if
+    needed. An existing recording is continued in a new segment.
+
+    A segment is closed and indexed once it holds segment_size bytes of
+    uncompressed JSON or spans segment_seconds. Events are buffered and
+    written at most flush_interval seconds after arrival; after a crash,
+    everything up to the last write can still be read.
+
+    Use attach() to record a client's subscription, or handler() to get a
+    subscribe() handler, e.g. for several queries or an EventRouter route.'''
+
+    def __init__(self, directory, segment_size=16 * 1024 * 1024,
+                 segment_seconds=3600, flush_interval=1.0):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.segment_seconds = segment_seconds
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+        segments = [name for name in os.listdir(directory) if name.endswith(SUFFIX)]
+        self._number = max((int(name[:-len(SUFFIX)]) for name in segments), default=0)
+        self._file = None
+        self._buffer = []
+        self._timer = None
+        self._start = self._end = None
+        self._size = self._count = 0
+        self.events = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def handler(self, host):
+        'Returns a subscribe() handler recording events as coming from host.'
+        def record(data, id_):
+            self.record(host, id_, data)
+        return record
+
+    async def attach(self, client, query, notify_current_value=False):
+        '''Subscribes client to query, recording its events under
+        client.host. Returns the subscription Id.'''
+        return await client.subscribe(query, self.handler(client.host),
+                                      notify_current_value)
+
+    def record(self, host, id_, data, timestamp=None):
+        'Records one event, received at timestamp (default now).'
+        if timestamp is None:
+            timestamp = time.time()
+        self._buffer.append((timestamp, host, id_, data))
+        self.events += 1
+        if self._timer is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            self._timer = loop.call_later(self.flush_interval, self.flush)
+
+    def flush(self):
+        'Writes buffered events to the current segment.'
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        buffer, self._buffer = self._buffer, []
+        lines = []
+        for event in buffer:
+            if self._file is not None and (
+                    self._size >= self.segment_size
+                    or event[0] - self._start >= self.segment_seconds):
+                self._write(lines)
+                lines = []
+                self._close_segment()
+            if self._file is None:
+                self._open_segment(event[0])
+            line = json.dumps(event, separators=(',', ':'), default=str) + '\n'
+            lines.append(line)
+            self._size += len(line)
+            self._count += 1
+            self._end = max(self._end, event[0])
+        self._write(lines)
+
+    def _write(self, lines):
+        if lines:
+            self._file.write(''.join(lines).encode())
+            self._file.flush()
+
+    def _open_segment(self, start):
+        self._number += 1
+        path = os.path.join(self.directory, f'{self._number:08d}{SUFFIX}')
+        self._file = gzip.open(path, 'wb')
+        self._start = self._end = start
+        self._size = self._count = 0
+
+    def _close_segment(self):
+        self._file.close()
+        entry = {'segment': os.path.basename(self._file.name), 'start': self._start,
+                 'end': self._end, 'events': self._count}
+        with open(os.path.join(self.directory, INDEX), 'a') as index:
+            index.write(json.dumps(entry) + '\n')
+        self._file = None
+
+    def close(self):
+        'Writes buffered events and closes the current segment.'
+        self.flush()
+        if self._file is not None:
+            self._close_segment()
+
+
+class Recording:
+    '''Reads a recording written by Recorder.
+
+    The index is used to skip segments outside the requested time range.
+    Segments missing from it, e.g. the one being written or one cut short by
+    a crash, are always read, up to where they end.'''
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def index(self):
+        '''Returns index entries for all segments in order, with start and
+        end None for segments not in the index.'''
+        indexed = {}
+        try:
+            with open(os.path.join(self.directory, INDEX)) as index:
+                for line in index:
+                    if line.strip():
+                        entry = json.loads(line)
+                        indexed[entry['segment']] = entry
+        except FileNotFoundError:
+            pass
+        names = sorted(name for name in os.listdir(self.directory)
+                       if name.endswith(SUFFIX))
+        return [indexed.get(name, {'segment': name, 'start': None, 'end': None,
+                                   'events': None})
+                for name in names]
+
+    def events(self, start=None, end=None, hosts=None):
+        '''Yields RecordedEvent in recorded order, optionally only those
+        between start and end (wall clock seconds) and from hosts.'''
+        if hosts is not None:
+            hosts = set(hosts)
+        for entry in self.index():
+            if entry['start'] is not None and (
+                    start is not None and entry['end'] < start
+                    or end is not None and entry['start'] > end):
+                continue
+            for event in self._read(entry['segment']):
+                if start is not None and event.time < start:
+                    continue
+                if end is not None and event.time > end:
+                    continue
+                if hosts is None or event.host in hosts:
+                    yield event
+
+    def __iter__(self):
+        return self.events()
+
+    def _read(self, name):
+        with gzip.open(os.path.join(self.directory, name), 'rb') as segment:
+            try:
+                for line in segment:
+                    if not line.endswith(b'\n'):
+                        break
+                    yield RecordedEvent(*json.loads(line))
+            except EOFError:
+                # Segment still being written, or cut short
+                return
+
+
+class Replay:
+    '''Feeds a Recording into subscribe() style handlers, at the recorded
+    pace divided by speed, or as fast as possible with speed None.
+
+    Replay stands in for a client: subscribe() and unsubscribe() behave like
+    XoWSClient's, so EventRouter and FeedbackStream work on it too. Handlers
+    get each event restricted to their query, as the codec would send it,
+    and their subscription Id. Awaitables returned by handlers are awaited
+    before the next event. current is the RecordedEvent being delivered.
+
+    start, end and hosts select events, see Recording.events().'''
+
+    def __init__(self, recording, speed=1.0, start=None, end=None, hosts=None):
+        if isinstance(recording, str):
+            recording = Recording(recording)
+        self.recording = recording
+        self.speed = speed
+        self._start = start
+        self._end = end
+        self._hosts = hosts
+        self._subscriptions = {}
+        self._ids = 0
+        self.current = None
+        self.delivered = 0
+
+    @property
+    def connected(self):
+        'Always True, a Replay has no connection to lose.'
+        return True
+
+    async def subscribe(self, query, handler, notify_current_value=False,
+                        coalesce=None):
+        # pylint: disable=unused-argument
+        '''Adds handler for events matching query, coalesced over windows of
+        coalesce seconds of real time if given, see XoWSClient.subscribe().
+        Returns a subscription Id.'''
+        if coalesce:
+            handler = Coalescer(handler, coalesce)
+        id_ = self._ids
+        self._ids += 1
+        self._subscriptions[id_] = (tree.query_trie(query), handler)
+        return id_
+
+    async def unsubscribe(self, id_):
+        'Removes a subscription.'
+        _, handler = self._subscriptions.pop(id_)
+        if isinstance(handler, Coalescer):
+            handler.close()
+        return True
+
+    async def run(self):
+        '''Replays all selected events. Returns the number of handler calls
+        made.'''
+        first = began = None
+        for event in self.recording.events(self._start, self._end, self._hosts):
+            if self.speed:
+                now = time.monotonic()
+                if first is None:
+                    first, began = event.time, now
+                delay = began + (event.time - first) / self.speed - now
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                # Let other tasks, e.g. FeedbackStream consumers, run
+                await asyncio.sleep(0)
+            self.current = event
+            for id_, (trie, handler) in list(self._subscriptions.items()):
+                data = tree.select(event.data, trie)
+                if not data:
+                    continue
+                ret = handler(data, id_)
+                if inspect.isawaitable(ret):
+                    await ret
+                self.delivered += 1
+        self.current = None
+        return self.delivered
@@ -0,0 +1,102 @@
+'Local fan-out of one feedback subscription to many handlers.'
+
+
+import asyncio
+import inspect
+import itertools
+import logging
+
+from . import tree
+
+
+_log = logging.getLogger(__name__)
+
+
+class EventRouter:
+    '''EventRouter holds a single broad subscription, by default
+    ['Status', '**'], and dispatches every event to all local handlers whose
+    pattern matches one of the event's leaf paths. This keeps the number of
+    subscriptions on the codec constant no matter how many handlers are
+    added, avoiding SubscriberCountExceeded.
+
+    Patterns may use '*' and '**', see xows.tree. A pattern also matches
+    everything below it, like a subscription query does.
+
+    Handlers are called as handler(data, id_), like subscribe() handlers,
+    with the full event as data and the id returned by add() as id_. A
+    handler is called at most once per event.'''
+
+    CACHE_SIZE = 4096
+
+    def __init__(self, client, query=('Status', '**'), notify_current_value=False):
+        self._client = client
+        self._query = list(query)
+        self._notify_current_value = notify_current_value
+        self._trie = tree.PathTrie()
+        self._routes = {}
+        self._ids = itertools.count()
+        self._cache = {}
+        self.id = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.stop()
+
+    async def start(self):
+        'Subscribes to the query on the codec.'
+        if self.id is None:
+            self.id = await self._client.subscribe(
+                self._query, self._dispatch, self._notify_current_value)
+
+    async def stop(self):
+        'Unsubscribes from the codec. Handlers are kept.'
+        id_, self.id = self.id, None
+        if id_ is not None:
+            await self._client.unsubscribe(id_)
+
+    def add(self, pattern, handler):
+        'Routes events matching pattern to handler. Returns an id for remove().'
+        pattern = tree.normalize_path(pattern)
+        if pattern[-1:] != ('**',):
+            pattern += ('**',)
+        id_ = next(self._ids)
+        route = (id_, handler)
+        self._routes[id_] = (pattern, route)
+        self._trie.add(pattern, route)
+        self._cache.clear()
+        return id_
+
+    def remove(self, id_):
+        'Removes a route added with add().'
+        pattern, route = self._routes.pop(id_)
+        self._trie.remove(pattern, route)
+        self._cache.clear()
+
+    def _match(self, path):
+        routes = self._cache.get(path)
+        if routes is None:
+            if len(self._cache) >= self.CACHE_SIZE:
+                self._cache.clear()
+            routes = self._cache[path] = self._trie.match(path)
+        return routes
+
+    def _dispatch(self, data, _):
+        matched = {}
+        for path, _value in tree.iter_leaves(data):
+            for id_, handler in self._match(path):
+                matched[id_] = handler
+        awaitables = []
+        for id_, handler in matched.items():
+            try:
+                ret = handler(data, id_)
+            except Exception: # pylint: disable=broad-except
+                _log.exception('Route %s handler failed', id_)
+                continue
+            if inspect.isawaitable(ret):
+                awaitables.append(ret)
+        if awaitables:
+            return asyncio.gather(*awaitables)
+        return None
@@ -0,0 +1,113 @@
+'''In-flight window and priority ordering for outgoing calls, see
+XoWSClient's max_in_flight.'''
+
+
+import asyncio
+import heapq
+import itertools
+
+
+INTERACTIVE = 0
+NORMAL = 1
+BULK = 2
+
+
+def default_priority(method):
+    '''Priority class of a jsonrpc method, lower is sent first: commands and
+    xSet are INTERACTIVE, xGet / xQuery inventory traffic is BULK and
+    everything else, e.g. subscriptions, NORMAL.'''
+    if method.startswith('xCommand/') or method == 'xSet':
+        return INTERACTIVE
+    if method in ('xGet', 'xQuery'):
+        return BULK
+    return NORMAL
+
+
+class SendScheduler:
+    '''Keeps at most max_in_flight calls outstanding on one connection.
+
+    Calls beyond the window wait in a queue ordered by priority class, then
+    by arrival. A slot is held from sending a call until it is answered,
+    times out or fails. A batch is admitted as soon as one slot is free and
+    holds one slot per call in it, so large batches may overshoot the window
+    rather than wait forever.
+
+    priority maps a method name to its class, default default_priority.'''
+
+    def __init__(self, max_in_flight, priority=None):
+        if max_in_flight < 1:
+            raise ValueError('max_in_flight must be at least 1')
+        self.max_in_flight = max_in_flight
+        self.priority = priority or default_priority
+        self._holders = set()
+        self._waiters = []
+        self._order = itertools.count()
+        self._woken = 0
+        self.queued = 0
+        self.waited = 0
+
+    @property
+    def in_flight(self):
+        'Number of calls holding a slot.'
+        return len(self._holders)
+
+    def _free(self):
+        return len(self._holders) + self._woken < self.max_in_flight
+
+    async def acquire(self, ids, priority, calls=()):
+        '''Waits for a slot, then marks the calls with ids as in flight and
+        returns True. Returns immediately if a slot is free and nothing is
+        queued. calls are the futures of the calls: once all of them are done,
+        i.e. the calls timed out or failed while queued, stops waiting and
+        returns False.'''
+        if not self._waiters and self._free():
+            self._holders.update(ids)
+            return True
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        self.queued += 1
+        self.waited += 1
+        remaining = len(calls)
+
+        def abandon(_):
+            nonlocal remaining
+            remaining -= 1
+            if remaining == 0 and not future.done():
+                future.set_result(False)
+
+        for call in calls:
+            call.add_done_callback(abandon)
+        try:
+            woken = await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.result():
+                # Woken, but cancelled before running: pass the slot on
+                self._woken -= 1
+                self._wake()
+            else:
+                self.queued -= 1
+            raise
+        finally:
+            for call in calls:
+                call.remove_done_callback(abandon)
+        if not woken:
+            self.queued -= 1
+            return False
+        self._woken -= 1
+        self._holders.update(ids)
+        return True
+
+    def release(self, id_):
+        'Frees the slot held by call id_, if any.'
+        if id_ in self._holders:
+            self._holders.discard(id_)
+            self._wake()
+
+    def _wake(self):
+        while self._waiters and self._free():
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            future.set_result(True)
+            self.queued -= 1
+            self._woken += 1
@@ -0,0 +1,206 @@
+'''Command and configuration schemas, for validating calls before sending.
+
+Schemas come from the codec's xDoc method and depend only on the software
+version, so SchemaCache fetches them once per version and keeps them on disk.
+A schema is the xDoc Schema tree for Command and Configuration: commands are
+dicts with 'command' set, their parameters and configuration leaves are
+dicts with a 'ValueSpace'. Value spaces of type Integer (Min, Max), Literal
+(Value) and String (MinLength, MaxLength) are checked, others are accepted
+as is.'''
+
+
+import json
+import os
+import re
+
+from . import InvalidParameter, MethodNotFound, tree
+
+
+VERSION_PATH = ['Status', 'SystemUnit', 'Software', 'Version']
+
+
+def _true(value):
+    return str(value).lower() == 'true'
+
+
+def _is_command(node):
+    return isinstance(node, dict) and _true(node.get('command'))
+
+
+def _is_leaf(node):
+    return isinstance(node, dict) and 'ValueSpace' in node
+
+
+def _child(node, part):
+    if isinstance(node, list):
+        # Multi instance nodes, e.g. Connector[n], share one schema
+        return node[0] if node else None
+    if isinstance(node, dict):
+        return node.get(part)
+    return None
+
+
+def _check_value(name, spec, value):
+    if isinstance(value, list):
+        for item in value:
+            _check_value(name, spec, item)
+        return
+    space = spec.get('ValueSpace') or {}
+    kind = space.get('type')
+    if kind == 'Integer':
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            raise InvalidParameter(f'{name}: {value!r} is not an integer') from None
+        low, high = space.get('Min'), space.get('Max')
+        if low is not None and number < int(low) or high is not None and number > int(high):
+            raise InvalidParameter(f'{name}: {number} not in range {low}..{high}')
+    elif kind == 'Literal':
+        values = space.get('Value') or []
+        if str(value).lower() not in (str(v).lower() for v in values):
+            raise InvalidParameter(f'{name}: {value!r} not one of {", ".join(map(str, values))}')
+    elif kind == 'String':
+        low, high = space.get('MinLength'), space.get('MaxLength')
+        length = len(str(value))
+        if low is not None and length < int(low) or high is not None and length > int(high):
+            raise InvalidParameter(f'{name}: length {length} not in range {low}..{high}')
+
+
+class Schema:
+    '''The schema of one software version. tree holds 'Command' and
+    'Configuration' as returned by xDoc.'''
+
+    def __init__(self, version, tree):
+        # pylint: disable=redefined-outer-name
+        self.version = version
+        self.tree = tree
+
+    def node(self, path):
+        'Returns the schema node at path, or None.'
+        node = self.tree
+        for part in tree.normalize_path(path):
+            node = _child(node, part)
+            if node is None:
+                return None
+        return node
+
+    def validate_command(self, command, params):
+        '''Raises MethodNotFound for unknown commands, InvalidParameter for
+        unknown, missing or out of range parameters.'''
+        node = self.node(['Command'] + list(command))
+        if not _is_command(node):
+            raise MethodNotFound(f'Unknown command: {" ".join(map(str, command))}')
+        for name, value in params.items():
+            spec = node.get(name)
+            if not _is_leaf(spec):
+                raise InvalidParameter(f'Unknown parameter: {name}')
+            _check_value(name, spec, value)
+        for name, spec in node.items():
+            if _is_leaf(spec) and _true(spec.get('required')) and name not in params:
+                raise InvalidParameter(f'Missing required parameter: {name}')
+
+    def validate_set(self, path, value):
+        '''Raises InvalidParameter for unknown configurations or invalid
+        values. Only paths under Configuration are checked.'''
+        path = tree.normalize_path(path)
+        if path[:1] != ('Configuration',):
+            return
+        spec = self.node(path)
+        if not _is_leaf(spec):
+            raise InvalidParameter(f'Unknown configuration: {" ".join(map(str, path))}')
+        _check_value(path[-1], spec, value)
+
+    def complete_command(self, words):
+        '''Returns completions for a command line given as words, the last
+        one being incomplete: sub commands, then Name= for parameters and
+        Name=Value for literal values.'''
+        *done, last = list(words) or ['']
+        command = [word for word in done if '=' not in word]
+        node = self.node(['Command'] + command)
+        if node is None:
+            return []
+        if not _is_command(node):
+            return sorted(name for name in node if name.startswith(last))
+        if '=' in last:
+            name, prefix = last.split('=', 1)
+            spec = node.get(name)
+            if not _is_leaf(spec):
+                return []
+            values = (spec['ValueSpace'] or {}).get('Value') or []
+            return [f'{name}={value}' for value in values
+                    if str(value).lower().startswith(prefix.lower())]
+        given = {word.split('=', 1)[0] for word in done if '=' in word}
+        return sorted(f'{name}=' for name, spec in node.items()
+                      if _is_leaf(spec) and name.startswith(last) and name not in given)
+
+
+def _cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'xows', 'schema')
+
+
+class SchemaCache:
+    '''Schemas by software version, kept as JSON files in directory (default
+    $XDG_CACHE_HOME/xows/schema). Also remembers the last version seen per
+    host, so host_schema() works without a connection, e.g. for completion.'''
+
+    def __init__(self, directory=None):
+        self.directory = directory or _cache_dir()
+        self._schemas = {}
+
+    def _path(self, name):
+        return os.path.join(self.directory, re.sub(r'[^\w.-]', '_', name) + '.json')
+
+    def _write(self, name, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(name)
+        with open(path + '.tmp', 'w', encoding='utf-8') as fh:
+            json.dump(data, fh)
+        os.replace(path + '.tmp', path)
+
+    def load(self, version):
+        'Returns the cached Schema for version, or None.'
+        if version not in self._schemas:
+            try:
+                with open(self._path(version), encoding='utf-8') as fh:
+                    self._schemas[version] = Schema(version, json.load(fh))
+            except (OSError, ValueError):
+                return None
+        return self._schemas[version]
+
+    def host_schema(self, host):
+        'Returns the cached Schema for the version host last ran, or None.'
+        try:
+            with open(self._path('hosts'), encoding='utf-8') as fh:
+                version = json.load(fh).get(host)
+        except (OSError, ValueError):
+            return None
+        return version and self.load(version)
+
+    def _remember_host(self, host, version):
+        try:
+            with open(self._path('hosts'), encoding='utf-8') as fh:
+                hosts = json.load(fh)
+        except (OSError, ValueError):
+            hosts = {}
+        if hosts.get(host) != version:
+            hosts[host] = version
+            self._write('hosts', hosts)
+
+    async def get(self, client):
+        '''Returns the Schema for the software version client is connected
+        to, fetching it with xDoc if it isn't cached yet. Raises XoWSError
+        if fetching fails.'''
+        version = await client.xGet(VERSION_PATH)
+        schema = self.load(version)
+        if schema is None:
+            data = {}
+            for root in ('Command', 'Configuration'):
+                data[root] = await client.api_call('xDoc', Path=[root], Type='Schema')
+            self._write(version, data)
+            schema = self._schemas[version] = Schema(version, data)
+        try:
+            self._remember_host(client.host, version)
+        except OSError:
+            pass
+        return schema
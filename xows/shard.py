@@ -0,0 +1,507 @@
+'''Spreading a large fleet over several processes, see ShardedFleet.
+
+One event loop decoding feedback from thousands of codecs saturates one
+core. ShardedFleet splits the hosts into shards, each served by an
+XoWSFleet in its own worker process. Workers send call results and feedback
+events back over a socket pair in batches, one length prefixed pickle of a
+list of messages per frame. The parent only sees those batches.'''
+
+
+import asyncio
+import collections
+import functools
+import inspect
+import itertools
+import logging
+import multiprocessing
+import os
+import pickle
+import signal
+import socket
+import struct
+import time
+
+from . import ConnectionClosed
+from .daemonclient import decode_error, encode_error
+from .fleet import HostResult, XoWSFleet
+from .overflow import OverflowQueue
+
+
+_log = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('!I')
+
+
+def _write_frame(writer, messages):
+    payload = pickle.dumps(messages, pickle.HIGHEST_PROTOCOL)
+    writer.write(_HEADER.pack(len(payload)) + payload)
+
+
+async def _read_frame(reader):
+    size, = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return pickle.loads(await reader.readexactly(size))
+
+
+def _worker_main(sock, options):
+    # The parent handles ^C and stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_Worker(sock, **options).run())
+
+
+class _Worker:
+    'Child process side: runs an XoWSFleet for the hosts it is given.'
+
+    def __init__(self, sock, username, password, heartbeat, batch_interval,
+                 outbox_maxsize, fleet_options):
+        self._sock = sock
+        self._fleet = XoWSFleet([], username, password, **fleet_options)
+        self._heartbeat = heartbeat
+        self._batch_interval = batch_interval
+        self._outbox_maxsize = outbox_maxsize
+        self._subscriptions = {}
+        self._server_ids = {}
+        self._outbox = []
+        self._wake = None
+        self._events = 0
+        self._dropped = 0
+
+    def _emit(self, message):
+        self._outbox.append(message)
+        self._wake.set()
+
+    async def run(self):
+        self._wake = asyncio.Event()
+        reader, writer = await asyncio.open_connection(sock=self._sock)
+        tasks = [asyncio.create_task(self._send_loop(writer)),
+                 asyncio.create_task(self._heartbeat_loop())]
+        try:
+            while True:
+                try:
+                    batch = await _read_frame(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    # Parent gone
+                    break
+                if not all(map(self._handle, batch)):
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await self._fleet.disconnect()
+            writer.close()
+
+    def _handle(self, message):
+        'Handles a message from the parent. Returns False on stop.'
+        kind, *args = message
+        if kind == 'connect':
+            asyncio.create_task(self._connect(*args))
+        elif kind == 'call':
+            asyncio.create_task(self._call(*args))
+        elif kind == 'subscribe':
+            sub_id, query, notify = args
+            self._subscriptions[sub_id] = (query, notify)
+            for client in list(self._fleet.clients.values()):
+                asyncio.create_task(self._subscribe(client, sub_id, query, notify))
+        elif kind == 'unsubscribe':
+            self._subscriptions.pop(args[0], None)
+            asyncio.create_task(self._unsubscribe(args[0]))
+        elif kind == 'stop':
+            return False
+        return True
+
+    async def _send_loop(self, writer):
+        while True:
+            await self._wake.wait()
+            # Collect what arrives meanwhile into the same frame
+            await asyncio.sleep(self._batch_interval)
+            self._wake.clear()
+            batch, self._outbox = self._outbox, []
+            _write_frame(writer, batch)
+            await writer.drain()
+
+    async def _heartbeat_loop(self):
+        while True:
+            clients = self._fleet.clients.values()
+            self._emit(('heartbeat', {
+                'pid': os.getpid(),
+                'clients': len(clients),
+                'connected': sum(client.connected for client in clients),
+                'events': self._events,
+                'dropped': self._dropped,
+            }))
+            await asyncio.sleep(self._heartbeat)
+
+    async def _subscribe_all(self, client):
+        for sub_id, (query, notify) in list(self._subscriptions.items()):
+            await self._subscribe(client, sub_id, query, notify)
+
+    async def _connect(self, hosts):
+        async for res in self._fleet.map(self._subscribe_all, hosts):
+            self._emit(('connected', res.host, res.error and encode_error(res.error)))
+
+    async def _call(self, call_id, method, params, hosts):
+        connected = [host for host in hosts if host in self._fleet.clients]
+        for host in set(hosts).difference(connected):
+            error = encode_error(ConnectionClosed(ConnectionClosed.__doc__))
+            self._emit(('result', call_id, host, None, error))
+        async for res in self._fleet.api_call(method, connected, **params):
+            self._emit(('result', call_id, res.host, res.result,
+                        res.error and encode_error(res.error)))
+
+    def _event(self, sub_id, host, data, _):
+        self._events += 1
+        if len(self._outbox) >= self._outbox_maxsize:
+            # The parent can't keep up, don't hold on to everything
+            self._dropped += 1
+            return
+        self._emit(('event', sub_id, host, data))
+
+    async def _subscribe(self, client, sub_id, query, notify):
+        handler = functools.partial(self._event, sub_id, client.host)
+        try:
+            self._server_ids[sub_id, client.host] = await client.subscribe(
+                query, handler, notify)
+        except Exception as err: # pylint: disable=broad-except
+            _log.error('%s: failed to subscribe %s: %r', client.host, query, err)
+
+    async def _unsubscribe(self, sub_id):
+        for (sub, host), id_ in list(self._server_ids.items()):
+            if sub != sub_id:
+                continue
+            del self._server_ids[sub, host]
+            client = self._fleet.clients.get(host)
+            if client is not None:
+                try:
+                    await client.unsubscribe(id_)
+                except Exception: # pylint: disable=broad-except
+                    pass
+
+
+class _Shard:
+    'Parent side of one worker process.'
+
+    def __init__(self, number, process, reader, writer):
+        self.number = number
+        self.process = process
+        self.reader = reader
+        self.writer = writer
+        self.hosts = set()
+        self.last_seen = time.monotonic()
+        self.stats = {}
+        self.task = None
+
+    def send(self, message):
+        if not self.writer.is_closing():
+            _write_frame(self.writer, [message])
+
+
+class ShardedFleet:
+    '''Like XoWSFleet, but with hosts spread over processes worker
+    processes (default one per CPU), each running its own event loop and
+    connections:
+
+        async with ShardedFleet(hosts, processes=8, password='secret') as fleet:
+            await fleet.subscribe(['Status', '**'], handler)
+            async for res in fleet.xGet(['Status', 'SystemUnit', 'Uptime']):
+                print(res.host, res.error or res.result)
+
+    Feedback handlers run in the parent and are called as handler(host,
+    data) by a task of their own; awaitables they return are awaited before
+    the next event. Up to event_maxsize events wait for the handlers,
+    event_overflow decides what happens when that is full, see
+    OverflowQueue. With 'block', reading from the workers waits for the
+    handlers, and the watchdog spares workers meanwhile.
+
+    Workers batch results and events for batch_interval seconds per frame,
+    and drop events once outbox_maxsize messages wait to be sent.
+    Exceptions come back as the xows or builtin exception of the same name,
+    otherwise as XoWSError, see xows.daemonclient.decode_error().
+
+    Workers report every heartbeat seconds. A worker that exits, or stays
+    silent for heartbeat_timeout seconds and is killed, is replaced, up to
+    max_restarts times in total. Its hosts are reassigned to the workers
+    with the fewest hosts, which reconnect and resubscribe them; calls
+    waiting for them fail with ConnectionClosed. worker_stats() and
+    restarts show how the workers are doing, connect_time how many seconds
+    the last connect() took to get every host connected or failed.
+
+    Other keyword arguments are passed on to each worker's XoWSFleet and
+    must be picklable; metrics can't be shared across processes.
+
+    Workers are started with the 'spawn' method by default, so scripts using
+    ShardedFleet need an if __name__ == '__main__' guard.
+
+    Can be used as an async context manager.'''
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, hosts, processes=None, username='admin', password='',
+                 heartbeat=1.0, heartbeat_timeout=10.0, max_restarts=10,
+                 batch_interval=0.005, event_maxsize=10000, event_overflow='block',
+                 outbox_maxsize=100000, start_method='spawn', **fleet_options):
+        self.hosts = list(dict.fromkeys(hosts))
+        self.processes = processes or os.cpu_count() or 1
+        self.heartbeat = heartbeat
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_restarts = max_restarts
+        self._context = multiprocessing.get_context(start_method)
+        self._worker_options = {
+            'username': username,
+            'password': password,
+            'heartbeat': heartbeat,
+            'batch_interval': batch_interval,
+            'outbox_maxsize': outbox_maxsize,
+            'fleet_options': fleet_options,
+        }
+        # Created in connect(), on the running loop
+        self._event_options = (event_maxsize, event_overflow)
+        self._events = None
+        self._dispatcher = None
+        self.failed = {}
+        self.restarts = 0
+        self.connect_time = None
+        self._shards = []
+        self._numbers = itertools.count()
+        self._owner = {}
+        self._connecting = {}
+        self._calls = {}
+        self._call_ids = itertools.count()
+        self._subscriptions = {}
+        self._sub_ids = itertools.count()
+        self._watchdog = None
+        self._stopping = False
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.disconnect()
+
+    async def connect(self):
+        '''Starts the workers and connects all hosts. Connection errors don't
+        propagate, they are stored in self.failed.'''
+        start = time.monotonic()
+        if self._events is None:
+            self._events = OverflowQueue(*self._event_options)
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+        if not self._shards:
+            for _ in range(max(1, min(self.processes, len(self.hosts)))):
+                await self._spawn()
+            self._watchdog = asyncio.create_task(self._watchdog_loop())
+        await self._assign([host for host in self.hosts if host not in self._owner])
+        self.connect_time = time.monotonic() - start
+
+    async def _spawn(self):
+        parent_sock, child_sock = socket.socketpair()
+        number = next(self._numbers)
+        process = self._context.Process(
+            target=_worker_main, args=(child_sock, self._worker_options),
+            name=f'xows-shard-{number}', daemon=True)
+        process.start()
+        child_sock.close()
+        reader, writer = await asyncio.open_connection(sock=parent_sock)
+        shard = _Shard(number, process, reader, writer)
+        for sub_id, (query, _, notify) in self._subscriptions.items():
+            shard.send(('subscribe', sub_id, query, notify))
+        shard.task = asyncio.create_task(self._read_loop(shard))
+        self._shards.append(shard)
+        return shard
+
+    async def _assign(self, hosts):
+        'Gives hosts to the least loaded workers and waits until connected.'
+        if not self._shards:
+            for host in hosts:
+                self.failed[host] = ConnectionClosed(ConnectionClosed.__doc__)
+            return
+        loop = asyncio.get_running_loop()
+        batches = collections.defaultdict(list)
+        for host in hosts:
+            shard = min(self._shards, key=lambda shard: len(shard.hosts))
+            shard.hosts.add(host)
+            self._owner[host] = shard
+            batches[shard].append(host)
+            self._connecting[host] = loop.create_future()
+        futures = [self._connecting[host] for host in hosts]
+        for shard, batch in batches.items():
+            shard.send(('connect', batch))
+        await asyncio.gather(*futures)
+
+    def _connected(self, host, error):
+        if error is None:
+            self.failed.pop(host, None)
+        else:
+            self.failed[host] = decode_error(error)
+        future = self._connecting.pop(host, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    async def _read_loop(self, shard):
+        try:
+            while True:
+                batch = await _read_frame(shard.reader)
+                shard.last_seen = time.monotonic()
+                for message in batch:
+                    if message[0] == 'event':
+                        await self._events.push(message)
+                    else:
+                        self._handle(shard, message)
+                # Waiting for the handlers isn't the worker's fault
+                shard.last_seen = time.monotonic()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        await self._lost(shard)
+
+    async def _dispatch_loop(self):
+        while True:
+            _, sub_id, host, data = await self._events.get()
+            subscription = self._subscriptions.get(sub_id)
+            if subscription is None:
+                continue
+            try:
+                ret = subscription[1](host, data)
+                if inspect.isawaitable(ret):
+                    await ret
+            except Exception: # pylint: disable=broad-except
+                _log.exception('%s: feedback handler failed', host)
+
+    def _handle(self, shard, message):
+        'Handles a message from a worker, other than a feedback event.'
+        kind, *args = message
+        if kind == 'result':
+            call_id, host, result, error = args
+            call = self._calls.get(call_id)
+            if call is not None and host in call[1]:
+                call[1].discard(host)
+                call[0].put_nowait(HostResult(host, result, error and decode_error(error)))
+        elif kind == 'connected':
+            self._connected(*args)
+        elif kind == 'heartbeat':
+            shard.stats = args[0]
+
+    async def _watchdog_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            if self._events.full():
+                # Frames wait unread until the handlers catch up
+                continue
+            now = time.monotonic()
+            for shard in self._shards:
+                if now - shard.last_seen > self.heartbeat_timeout and shard.process.is_alive():
+                    _log.warning('shard %d (pid %s): no heartbeat for %.0f s, killing',
+                                 shard.number, shard.process.pid, now - shard.last_seen)
+                    shard.process.kill()
+
+    async def _lost(self, shard):
+        if shard not in self._shards:
+            return
+        self._shards.remove(shard)
+        shard.writer.close()
+        await asyncio.get_running_loop().run_in_executor(None, shard.process.join)
+        error = ConnectionClosed(ConnectionClosed.__doc__)
+        for queue, waiting in self._calls.values():
+            for host in shard.hosts & waiting:
+                waiting.discard(host)
+                queue.put_nowait(HostResult(host, None, error))
+        for host in shard.hosts:
+            self._owner.pop(host, None)
+            future = self._connecting.pop(host, None)
+            if future is not None and not future.done():
+                future.set_result(None)
+        if self._stopping:
+            return
+        _log.warning('shard %d (pid %s) exited with %s, moving %d hosts',
+                     shard.number, shard.process.pid, shard.process.exitcode,
+                     len(shard.hosts))
+        if self.restarts < self.max_restarts:
+            self.restarts += 1
+            await self._spawn()
+        await self._assign(sorted(shard.hosts))
+
+    async def api_call(self, method, hosts=None, **params):
+        '''Performs a jsonrpc call on every connected host (or the subset
+        given in hosts), yielding HostResult in completion order.'''
+        if hosts is None:
+            hosts = self.hosts
+        batches = collections.defaultdict(list)
+        for host in hosts:
+            if host in self._owner and host not in self.failed:
+                batches[self._owner[host]].append(host)
+        call_id = next(self._call_ids)
+        queue = asyncio.Queue()
+        waiting = {host for batch in batches.values() for host in batch}
+        self._calls[call_id] = (queue, waiting)
+        try:
+            for shard, batch in batches.items():
+                shard.send(('call', call_id, method, params, batch))
+            for _ in range(len(waiting)):
+                yield await queue.get()
+        finally:
+            del self._calls[call_id]
+
+    def xGet(self, path, hosts=None):
+        'Gets a value or subtree from all hosts.'
+        return self.api_call('xGet', hosts, Path=path)
+
+    def xQuery(self, query, hosts=None):
+        'Queries a tree on all hosts.'
+        return self.api_call('xQuery', hosts, Query=query)
+
+    def xSet(self, path, value, hosts=None):
+        'Sets a value on all hosts.'
+        return self.api_call('xSet', hosts, Path=path, Value=value)
+
+    def xCommand(self, command, hosts=None, **params):
+        'Runs a command on all hosts.'
+        return self.api_call('xCommand/' + '/'.join(command), hosts, **params)
+
+    async def subscribe(self, query, handler, notify_current_value=False):
+        '''Subscribes every host, current and future, to query. Returns a
+        subscription Id for unsubscribe().'''
+        sub_id = next(self._sub_ids)
+        self._subscriptions[sub_id] = (query, handler, notify_current_value)
+        for shard in self._shards:
+            shard.send(('subscribe', sub_id, query, notify_current_value))
+        return sub_id
+
+    async def unsubscribe(self, sub_id):
+        'Removes a subscription from every host.'
+        del self._subscriptions[sub_id]
+        for shard in self._shards:
+            shard.send(('unsubscribe', sub_id))
+
+    def worker_stats(self):
+        '''Returns a dict per worker with its pid, number of hosts assigned,
+        clients and connected clients, events received and dropped because
+        its outbox was full, and seconds since its last heartbeat.'''
+        now = time.monotonic()
+        return [{
+            'pid': shard.process.pid,
+            'hosts': len(shard.hosts),
+            'clients': shard.stats.get('clients', 0),
+            'connected': shard.stats.get('connected', 0),
+            'events': shard.stats.get('events', 0),
+            'dropped': shard.stats.get('dropped', 0),
+            'silent': round(now - shard.last_seen, 3),
+        } for shard in self._shards]
+
+    async def disconnect(self, timeout=10.0):
+        '''Stops all workers, which disconnect their clients. Workers still
+        running after timeout seconds are killed.'''
+        self._stopping = True
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+        shards = list(self._shards)
+        for shard in shards:
+            shard.send(('stop',))
+        tasks = [shard.task for shard in shards]
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            if pending:
+                for shard in shards:
+                    if shard.process.is_alive():
+                        shard.process.kill()
+                await asyncio.wait(pending)
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = self._events = None
+        self._owner.clear()
@@ -0,0 +1,177 @@
+'''Blocking facade over XoWSClient for threaded code, see SyncClient.'''
+
+
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import queue
+import threading
+
+from .client import XoWSClient
+
+
+_log = logging.getLogger(__name__)
+
+
+class SyncClient:
+    '''Blocking calls to any number of codecs, safe to use from many threads
+    at once, e.g. the workers of a Django or Celery service:
+
+        codecs = xows.SyncClient(password='secret')
+        codecs.xCommand('codec1', ['Audio', 'Volume', 'Set'], Level=50)
+        print(codecs.xGet('codec2', ['Status', 'Audio', 'Volume']))
+
+    SyncClient runs an event loop in a background thread, holding one
+    XoWSClient per host. A host is connected on first use, with username and
+    password unless connect() was called for it first, and stays connected;
+    a client that lost its connection is replaced on the next call, which
+    drops its subscriptions; pass reconnect=True to keep them. client_options
+    are passed on to XoWSClient.
+
+    Feedback handlers are run by a pool of handler_threads threads, so they
+    may block and make calls themselves. With more than one thread, events
+    can be handled out of order; pass a queue.Queue as handler to keep it.
+    dropped counts events that didn't fit such a queue.
+
+    Create the SyncClient in the process using it, i.e. after forking, and
+    close() it when done. Can be used as a context manager.'''
+
+    def __init__(self, username='admin', password='', handler_threads=4,
+                 **client_options):
+        self._username = username
+        self._password = password
+        self._client_options = client_options
+        self._clients = {}
+        self._credentials = {}
+        self._locks = {}
+        self._closed = False
+        self.dropped = 0
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            handler_threads, thread_name_prefix='xows-handler')
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        name='xows-loop', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _run(self, coro):
+        if self._closed:
+            coro.close()
+            raise RuntimeError('SyncClient is closed')
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError('Blocking SyncClient call from its event loop')
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _connect(self, host):
+        client = self._clients.get(host)
+        if client is not None and client.connected:
+            return client
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            client = self._clients.get(host)
+            if client is None or not client.connected:
+                username, password = self._credentials.get(
+                    host, (self._username, self._password))
+                client = XoWSClient(host, username, password, **self._client_options)
+                await client.connect()
+                self._clients[host] = client
+        return client
+
+    async def _call(self, host, name, *args, **kwargs):
+        client = await self._connect(host)
+        return await getattr(client, name)(*args, **kwargs)
+
+    def connect(self, host, username=None, password=None):
+        '''Connects to host now rather than on first use, optionally with
+        other credentials than the default ones.'''
+        if username is not None or password is not None:
+            self._credentials[host] = (username if username is not None else self._username,
+                                       password if password is not None else self._password)
+        self._run(self._connect(host))
+
+    def client(self, host):
+        '''Returns the XoWSClient for host, connecting if needed. Its methods
+        must only be used on the event loop, see run().'''
+        return self._run(self._connect(host))
+
+    def run(self, coro):
+        'Runs coro on the event loop and returns its result.'
+        return self._run(coro)
+
+    def api_call(self, host, method, timeout=None, **params):
+        'Performs a jsonrpc call on host, see XoWSClient.api_call().'
+        return self._run(self._call(host, 'api_call', method, timeout, **params))
+
+    def xGet(self, host, path, timeout=None):
+        'Gets a value or subtree from host.'
+        return self._run(self._call(host, 'xGet', path, timeout))
+
+    def xQuery(self, host, query, timeout=None):
+        'Queries a tree on host.'
+        return self._run(self._call(host, 'xQuery', query, timeout))
+
+    def xSet(self, host, path, value, timeout=None):
+        'Sets a value on host. Returns True on success.'
+        return self._run(self._call(host, 'xSet', path, value, timeout))
+
+    def xCommand(self, host, command, timeout=None, **params):
+        'Runs a command on host.'
+        return self._run(self._call(host, 'xCommand', command, timeout, **params))
+
+    def subscribe(self, host, query, handler, notify_current_value=False):
+        '''Subscribes to feedback from host. handler is called as
+        handler(data, id_) in a handler thread, or, if it is a queue.Queue,
+        gets (data, id_) put into it. Events that don't fit a full queue are
+        dropped and logged. Returns the subscription Id.'''
+        if hasattr(handler, 'put_nowait'):
+            deliver = functools.partial(self._put, handler)
+        else:
+            deliver = functools.partial(self._submit, handler)
+        return self._run(self._call(host, 'subscribe', query, deliver,
+                                    notify_current_value))
+
+    def _submit(self, handler, data, id_):
+        self._executor.submit(handler, data, id_).add_done_callback(self._handler_done)
+
+    @staticmethod
+    def _handler_done(future):
+        if not future.cancelled() and future.exception() is not None:
+            _log.error('feedback handler failed', exc_info=future.exception())
+
+    def _put(self, queue_, data, id_):
+        # Never block the event loop
+        try:
+            queue_.put_nowait((data, id_))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                _log.warning('feedback queue full, dropped %d events so far',
+                             self.dropped)
+
+    def unsubscribe(self, host, id_):
+        'Removes a subscription on host.'
+        return self._run(self._call(host, 'unsubscribe', id_))
+
+    async def _disconnect(self):
+        clients, self._clients = self._clients, {}
+        await asyncio.gather(*(client.disconnect() for client in clients.values()),
+                             return_exceptions=True)
+
+    def close(self):
+        '''Disconnects all clients, stops the event loop and waits for
+        running handlers.'''
+        if self._closed:
+            return
+        self._run(self._disconnect())
+        self._closed = True
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._executor.shutdown()
@@ -0,0 +1,383 @@
+'''In-process stand-in for a codec, for tests and benchmarks without hardware.
+
+    async with MockCodec(latency=0.005, feedback_rate=100) as codec:
+        async with xows.XoWSClient(codec.url) as client:
+            print(await client.xGet(['Status', 'Audio', 'Volume']))
+'''
+
+
+import asyncio
+import copy
+import inspect
+import itertools
+import time
+
+import aiohttp
+from aiohttp import web
+
+from . import EXCEPTION_TYPES, XoWSError, tree
+from .jsonlib import get_backend
+
+
+ERROR_CODES = {exception: code for code, exception in EXCEPTION_TYPES.items()}
+
+DEFAULT_TREE = {
+    'Status': {
+        'Audio': {
+            'Volume': 50,
+            'Microphones': {'Mute': 'Off'},
+            'Input': {'Connectors': {'Microphone': [
+                {'id': 1, 'ConnectionStatus': 'Connected', 'VuMeter': 0},
+                {'id': 2, 'ConnectionStatus': 'NotConnected', 'VuMeter': 0},
+            ]}},
+        },
+        'Call': [],
+        'RoomAnalytics': {'PeopleCount': {'Current': 0}},
+        'Standby': {'State': 'Off'},
+        'SystemUnit': {
+            'ProductId': 'Cisco Webex Room Kit',
+            'Software': {'Version': 'ce9.15.0.19b7a5f7d37', 'DisplayName': 'RoomOS 9.15.0'},
+            'State': {'NumberOfActiveCalls': 0, 'NumberOfInProgressCalls': 0,
+                      'NumberOfSuspendedCalls': 0},
+            'Uptime': 1000,
+        },
+    },
+    'Configuration': {
+        'Audio': {'DefaultVolume': 50, 'Ultrasound': {'MaxVolume': 70}},
+        'SystemUnit': {'Name': 'Mock Codec'},
+        'Video': {'Input': {'Connector': [
+            {'id': 1, 'Quality': 'Motion'},
+            {'id': 2, 'Quality': 'Sharpness'},
+        ]}},
+    },
+}
+
+def _integer(low, high, **spec):
+    return dict(spec, ValueSpace={'type': 'Integer', 'Min': str(low), 'Max': str(high)})
+
+def _literal(*values, **spec):
+    return dict(spec, ValueSpace={'type': 'Literal', 'Value': list(values)})
+
+DEFAULT_SCHEMA = {
+    'Command': {
+        'Audio': {'Volume': {'Set': {'command': 'True',
+                                     'Level': _integer(0, 100, required='True')}}},
+        'Call': {
+            'Disconnect': {'command': 'True', 'CallId': _integer(0, 65534)},
+            'Hold': {'command': 'True', 'CallId': _integer(0, 65534),
+                     'Reason': _literal('Conference', 'Transfer', 'Other')},
+        },
+        'Standby': {'Activate': {'command': 'True'},
+                    'Deactivate': {'command': 'True'}},
+    },
+    'Configuration': {
+        'Audio': {'DefaultVolume': _integer(0, 100),
+                  'Ultrasound': {'MaxVolume': _integer(0, 90)}},
+        'SystemUnit': {'Name': {'ValueSpace': {'type': 'String', 'MinLength': '0',
+                                               'MaxLength': '50'}}},
+        'Video': {'Input': {'Connector': [{'Quality': _literal('Motion', 'Sharpness')}]}},
+    },
+}
+
+FEEDBACK_PATHS = [
+    ('Status', 'Audio', 'Input', 'Connectors', 'Microphone', 1, 'VuMeter'),
+    ('Status', 'RoomAnalytics', 'PeopleCount', 'Current'),
+    ('Status', 'SystemUnit', 'Uptime'),
+]
+
+
+class _Connection:
+    def __init__(self, ws):
+        self.ws = ws
+        self.subscriptions = {}
+        self.ids = itertools.count()
+
+
+class MockCodec:
+    '''aiohttp websocket server speaking the codec's jsonrpc dialect.
+
+    Supports xGet, xQuery, xSet, xCommand/*, xFeedback/Subscribe,
+    xFeedback/Unsubscribe and xDoc, single and batched. The document tree
+    starts as a copy of tree (default DEFAULT_TREE), xDoc answers from schema
+    (default DEFAULT_SCHEMA).
+
+    latency delays every response, in seconds, or is a callable returning
+    the delay. feedback_rate generates that many feedback events per second,
+    changing the values in FEEDBACK_PATHS in turn.
+
+    fail_status makes the websocket handshake fail with that HTTP status
+    (e.g. 401, 403 or 503) for the first fail_count connections, or all of
+    them if fail_count is None. retry_after is sent as Retry-After.
+    Credentials other than username / password are rejected with 403.
+
+    commands maps command paths (tuples) to callables taking the params as
+    keyword arguments; raise an XoWSError subclass to return its error code.
+    errors maps method names to an error code from EXCEPTION_TYPES to force
+    for every call. Use update() to change the tree and send feedback, and
+    drop_connections() to simulate a reboot.'''
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, tree=None, username='admin', password='', latency=0,
+                 feedback_rate=0, fail_status=None, fail_count=None,
+                 retry_after=None, max_subscriptions=50, schema=None,
+                 host='127.0.0.1', port=0):
+        # pylint: disable=redefined-outer-name
+        self.tree = copy.deepcopy(DEFAULT_TREE if tree is None else tree)
+        self.schema = DEFAULT_SCHEMA if schema is None else schema
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.feedback_rate = feedback_rate
+        self.fail_status = fail_status
+        self.fail_count = fail_count
+        self.retry_after = retry_after
+        self.max_subscriptions = max_subscriptions
+        self.commands = {
+            ('Audio', 'Volume', 'Set'): self._volume_set,
+            ('Call', 'Disconnect'): self._ok,
+            ('Call', 'Hold'): self._ok,
+            ('Standby', 'Activate'): self._ok,
+            ('Standby', 'Deactivate'): self._ok,
+        }
+        self.errors = {}
+        self.requests = 0
+        self.connections = set()
+        self._json = get_backend('json')
+        self._host = host
+        self._port = port
+        self._runner = self._feedback_task = None
+        self.url = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.stop()
+
+    async def start(self):
+        'Starts listening. The websocket url is found in self.url.'
+        app = web.Application()
+        app.router.add_get('/ws', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self._host, self._port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f'ws://{self._host}:{port}/ws'
+        if self.feedback_rate:
+            self._feedback_task = asyncio.create_task(self._generate_feedback())
+
+    async def stop(self):
+        'Closes all connections and stops listening.'
+        if self._feedback_task:
+            self._feedback_task.cancel()
+        await self.drop_connections()
+        await self._runner.cleanup()
+
+    async def drop_connections(self):
+        'Closes all client connections, as a codec reboot would.'
+        await asyncio.gather(*(conn.ws.close() for conn in list(self.connections)),
+                             return_exceptions=True)
+
+    def _check_auth(self, request):
+        header = request.headers.get('Authorization')
+        if header is None:
+            return 401
+        try:
+            auth = aiohttp.BasicAuth.decode(header)
+        except ValueError:
+            return 401
+        if (auth.login, auth.password) != (self.username, self.password):
+            return 403
+        return None
+
+    async def _handle(self, request):
+        status = None
+        if self.fail_status and (self.fail_count is None or self.fail_count > 0):
+            status = self.fail_status
+            if self.fail_count is not None:
+                self.fail_count -= 1
+        status = status or self._check_auth(request)
+        if status:
+            headers = {}
+            if self.retry_after is not None:
+                headers['Retry-After'] = str(self.retry_after)
+            return web.Response(status=status, headers=headers)
+
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        conn = _Connection(ws)
+        self.connections.add(conn)
+        try:
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    await self._receive(conn, msg.data)
+        finally:
+            self.connections.discard(conn)
+        return ws
+
+    async def _receive(self, conn, text):
+        try:
+            data = self._json.loads(text)
+        except ValueError:
+            await self._send(conn, self._error(None, -32700, 'Parse error'))
+            return
+        if isinstance(data, list):
+            delay = self._delay()
+            if delay:
+                asyncio.create_task(self._respond_batch(conn, data, delay))
+            else:
+                await self._respond_batch(conn, data, 0)
+        else:
+            delay = self._delay()
+            if delay:
+                asyncio.create_task(self._respond(conn, data, delay))
+            else:
+                await self._respond(conn, data, 0)
+
+    def _delay(self):
+        return self.latency() if callable(self.latency) else self.latency
+
+    async def _respond(self, conn, request, delay):
+        if delay:
+            await asyncio.sleep(delay)
+        response, after = await self._call(conn, request)
+        await self._send(conn, response)
+        if after:
+            await after()
+
+    async def _respond_batch(self, conn, requests, delay):
+        if delay:
+            await asyncio.sleep(delay)
+        responses = []
+        afters = []
+        for request in requests:
+            response, after = await self._call(conn, request)
+            responses.append(response)
+            if after:
+                afters.append(after)
+        await self._send(conn, responses)
+        for after in afters:
+            await after()
+
+    async def _send(self, conn, message):
+        if not conn.ws.closed:
+            await conn.ws.send_str(self._json.dumps(message))
+
+    @staticmethod
+    def _error(id_, code, message, data=None):
+        error = {'code': code, 'message': message}
+        if data is not None:
+            error['data'] = data
+        return {'jsonrpc': '2.0', 'id': id_, 'error': error}
+
+    async def _call(self, conn, request):
+        '''Returns the response, and a coroutine function to run after the
+        response has been sent, or None.'''
+        self.requests += 1
+        id_ = request.get('id') if isinstance(request, dict) else None
+        method = request.get('method') if isinstance(request, dict) else None
+        if not isinstance(method, str):
+            return self._error(id_, -32600, 'Invalid request'), None
+        if method in self.errors:
+            code = self.errors[method]
+            return self._error(id_, code, EXCEPTION_TYPES[code].__doc__), None
+        params = request.get('params') or {}
+        after = None
+        try:
+            if method == 'xGet':
+                result = tree.get(self.tree, params['Path'])
+            elif method == 'xQuery':
+                result = tree.select(self.tree, tree.query_trie(params['Query']))
+            elif method == 'xSet':
+                result, after = self._set(params['Path'], params['Value'])
+            elif method == 'xFeedback/Subscribe':
+                result, after = self._subscribe(conn, params)
+            elif method == 'xDoc':
+                result = tree.get(self.schema, params['Path'])
+            elif method == 'xFeedback/Unsubscribe':
+                del conn.subscriptions[params['Id']]
+                result = True
+            elif method.startswith('xCommand/'):
+                result = await self._command(tuple(method.split('/')[1:]), params)
+            else:
+                return self._error(id_, -32601, 'Method not found'), None
+        except KeyError as err:
+            return self._error(id_, -32602, 'No match on Path argument', str(err)), None
+        except XoWSError as err:
+            code = ERROR_CODES.get(type(err), 1)
+            message = err.args[0] if err.args else type(err).__doc__
+            data = err.args[1] if len(err.args) > 1 else None
+            return self._error(id_, code, message, data), None
+        return {'jsonrpc': '2.0', 'id': id_, 'result': result}, after
+
+    def _set(self, path, value):
+        path = tree.normalize_path(path)
+        tree.get(self.tree, path)
+        update = tree.build([(path, value)])
+        return True, lambda: self.update(update)
+
+    def _subscribe(self, conn, params):
+        if sum(len(c.subscriptions) for c in self.connections) >= self.max_subscriptions:
+            raise EXCEPTION_TYPES[-31998]('Global subscription count exceeded')
+        id_ = next(conn.ids)
+        trie = tree.query_trie(params['Query'])
+        conn.subscriptions[id_] = trie
+        if not params.get('NotifyCurrentValue'):
+            return {'Id': id_}, None
+        current = tree.select(self.tree, trie)
+        async def notify():
+            if current:
+                await self._send(conn, self._event(id_, current))
+        return {'Id': id_}, notify
+
+    async def _command(self, command, params):
+        if command not in self.commands:
+            raise EXCEPTION_TYPES[-32601]('Method not found')
+        result = self.commands[command](**params)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    @staticmethod
+    def _event(id_, data):
+        params = {'Id': id_}
+        params.update(data)
+        return {'jsonrpc': '2.0', 'method': 'xFeedback/Event', 'params': params}
+
+    async def update(self, data):
+        '''Merges data into the tree and sends feedback to all matching
+        subscriptions.'''
+        tree.merge(self.tree, copy.deepcopy(data))
+        leaves = list(tree.iter_leaves(data))
+        for conn in list(self.connections):
+            for id_, trie in list(conn.subscriptions.items()):
+                matched = [(path, value) for path, value in leaves if trie.match(path)]
+                if matched:
+                    await self._send(conn, self._event(id_, tree.build(matched)))
+
+    async def _volume_set(self, Level): # pylint: disable=invalid-name
+        level = int(Level)
+        if not 0 <= level <= 100:
+            raise EXCEPTION_TYPES[-32602]('Level out of range')
+        await self.update({'Status': {'Audio': {'Volume': level}}})
+        return {'status': 'OK'}
+
+    @staticmethod
+    def _ok(**_):
+        return {'status': 'OK'}
+
+    async def _generate_feedback(self):
+        paths = itertools.cycle(FEEDBACK_PATHS)
+        counter = itertools.count()
+        interval = 0.01
+        sent = 0
+        start = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            due = int((time.monotonic() - start) * self.feedback_rate) - sent
+            for _ in range(due):
+                await self.update(tree.build([(next(paths), next(counter) % 100)]))
+            sent += due
@@ -0,0 +1,258 @@
+'''Helpers for xAPI document trees as returned by xGet, xQuery and feedback.
+
+Lists in these trees hold dicts carrying an 'id' key. In paths, list items
+are addressed by that id, either as an int element or as 'Name[id]', so
+['Status', 'Call', 23, 'Status'] and ['Status', 'Call[23]', 'Status'] are the
+same path. A list item with 'ghost' set means the item was removed.
+
+Patterns, as used by PathTrie, are paths that may also contain '*' matching
+any single element (including list ids, also written 'Name[*]') and '**'
+matching any number of elements.'''
+
+
+import re
+
+
+_INDEXED = re.compile(r'^(.*)\[(\d+|\*)\]$')
+
+
+def normalize_path(path):
+    'Returns path as a tuple, splitting "Name[id]" elements into Name, id.'
+    ret = []
+    for part in path:
+        if isinstance(part, str):
+            match = _INDEXED.match(part)
+            if match:
+                ret.append(match.group(1))
+                index = match.group(2)
+                ret.append('*' if index == '*' else int(index))
+                continue
+        ret.append(part)
+    return tuple(ret)
+
+
+def _is_ghost(item):
+    return str(item.get('ghost', 'False')).lower() == 'true'
+
+
+def merge(tree, update):
+    '''Merges update into tree, modifying and returning tree.
+
+    Dicts are merged recursively, list items are merged by id and removed
+    when update marks them as ghost. Anything else in update replaces the
+    value in tree.'''
+
+    for key, value in update.items():
+        old = tree.get(key)
+        if isinstance(value, dict) and isinstance(old, dict):
+            merge(old, value)
+        elif isinstance(value, list) and isinstance(old, list):
+            _merge_list(old, value)
+        elif isinstance(value, list):
+            tree[key] = [item for item in value
+                         if not (isinstance(item, dict) and _is_ghost(item))]
+        else:
+            tree[key] = value
+    return tree
+
+
+def _merge_list(old, update):
+    index = {item.get('id'): pos for pos, item in enumerate(old)
+             if isinstance(item, dict)}
+    removed = set()
+    for item in update:
+        if not isinstance(item, dict) or 'id' not in item:
+            old.append(item)
+            continue
+        pos = index.get(item['id'])
+        if _is_ghost(item):
+            if pos is not None:
+                removed.add(pos)
+        elif pos is None:
+            index[item['id']] = len(old)
+            old.append(item)
+        else:
+            removed.discard(pos)
+            merge(old[pos], item)
+    if removed:
+        old[:] = [item for pos, item in enumerate(old) if pos not in removed]
+
+
+def get(tree, path):
+    'Returns the value at path in tree. Raises KeyError if not present.'
+    node = tree
+    for part in normalize_path(path):
+        if isinstance(part, int) and isinstance(node, list):
+            for item in node:
+                if isinstance(item, dict) and item.get('id') == part:
+                    node = item
+                    break
+            else:
+                raise KeyError(part)
+        elif isinstance(node, dict):
+            node = node[part]
+        else:
+            raise KeyError(part)
+    return node
+
+
+def iter_leaves(tree, prefix=()):
+    '''Yields (path, value) for every leaf in tree. List items contribute
+    their id to the path, the id itself is not yielded as a leaf.'''
+
+    if isinstance(tree, dict):
+        for key, value in tree.items():
+            yield from iter_leaves(value, prefix + (key,))
+    elif isinstance(tree, list):
+        for pos, item in enumerate(tree):
+            if isinstance(item, dict) and 'id' in item:
+                path = prefix + (item['id'],)
+                if _is_ghost(item):
+                    yield path + ('ghost',), item['ghost']
+                    continue
+                for key, value in item.items():
+                    if key != 'id':
+                        yield from iter_leaves(value, path + (key,))
+            else:
+                yield from iter_leaves(item, prefix + (pos,))
+    else:
+        yield prefix, tree
+
+
+def build(leaves):
+    '''Builds a tree from (path, value) pairs, the inverse of iter_leaves().
+
+    Int path elements become list items with that id.'''
+
+    root = {}
+    for path, value in leaves:
+        node = root
+        for pos, part in enumerate(path[:-1]):
+            if isinstance(node, list):
+                node = _list_item(node, part)
+            else:
+                node = node.setdefault(part, [] if isinstance(path[pos + 1], int) else {})
+        if isinstance(node, list):
+            node.append(value)
+        else:
+            node[path[-1]] = value
+    return root
+
+
+def _list_item(node, id_):
+    for item in node:
+        if item.get('id') == id_:
+            return item
+    item = {'id': id_}
+    node.append(item)
+    return item
+
+
+class _Node:
+    __slots__ = ('children', 'star', 'globstar', 'loop', 'values')
+
+    def __init__(self, loop=False):
+        self.children = {}
+        self.star = self.globstar = None
+        self.loop = loop
+        self.values = []
+
+    def child(self, part):
+        if part == '*':
+            if self.star is None:
+                self.star = _Node()
+            return self.star
+        if part == '**':
+            if self.globstar is None:
+                self.globstar = _Node(loop=True)
+            return self.globstar
+        node = self.children.get(part)
+        if node is None:
+            node = self.children[part] = _Node()
+        return node
+
+
+class PathTrie:
+    '''Maps patterns to values, and finds the values of all patterns
+    matching a path in one walk over the path.'''
+
+    def __init__(self):
+        self._root = _Node()
+
+    def add(self, pattern, value):
+        'Adds value for pattern.'
+        node = self._root
+        for part in normalize_path(pattern):
+            node = node.child(part)
+        node.values.append(value)
+
+    def remove(self, pattern, value):
+        'Removes value for pattern. Raises ValueError if not present.'
+        node = self._root
+        for part in normalize_path(pattern):
+            node = node.child(part)
+        node.values.remove(value)
+
+    @staticmethod
+    def _expand(nodes):
+        # '**' matches zero elements too
+        ret = []
+        for node in nodes:
+            while node is not None and node not in ret:
+                ret.append(node)
+                node = node.globstar
+        return ret
+
+    def _walk(self, path):
+        states = self._expand([self._root])
+        for part in path:
+            nxt = []
+            for node in states:
+                child = node.children.get(part)
+                if child is not None:
+                    nxt.append(child)
+                if node.star is not None:
+                    nxt.append(node.star)
+                if node.loop:
+                    nxt.append(node)
+            if not nxt:
+                return []
+            states = self._expand(nxt)
+        return states
+
+    def could_match(self, prefix):
+        '''True if some pattern may match prefix or a path below it, i.e. the
+        subtree at prefix can't be skipped.'''
+        return bool(self._walk(prefix))
+
+    def match(self, path):
+        'Returns the values of all patterns matching path.'
+        ret = []
+        for node in self._walk(path):
+            for value in node.values:
+                if value not in ret:
+                    ret.append(value)
+        return ret
+
+
+def query_trie(query):
+    '''Returns a PathTrie matching what a feedback subscription or xQuery for
+    query covers, i.e. query and everything below it.'''
+    return queries_trie([query])
+
+
+def queries_trie(queries):
+    'Returns a PathTrie matching what any of queries covers, see query_trie().'
+    trie = PathTrie()
+    for query in queries:
+        query = normalize_path(query)
+        if query[-1:] != ('**',):
+            query += ('**',)
+        trie.add(query, True)
+    return trie
+
+
+def select(tree, trie):
+    'Returns the subtree of tree with the leaves matching trie, or {}.'
+    return build((path, value) for path, value in iter_leaves(tree)
+                 if trie.match(path))